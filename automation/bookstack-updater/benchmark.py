@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+BookStack Updater Benchmarks
+Measures sync and parse performance against an in-process fake BookStack
+API and synthetic audit data, so regressions show up before deploying.
+"""
+
+import argparse
+import json
+import logging
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from fakes import FakeBookStack, FakeInventoryAPI, FakeKubernetes, FakeProxmox, generate_audit_data, write_config
+
+logger = logging.getLogger(__name__)
+
+PARSER_METHODS = [
+    'get_proxmox_nodes',
+    'get_vms',
+    'get_k3s_nodes',
+    'get_k3s_namespaces',
+    'get_k3s_deployments',
+    'get_k3s_services',
+    'get_k3s_ingresses',
+]
+
+
+def _run_case(case: str, scale: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one benchmark case; executed in a fresh child process"""
+    import bookstack_updater
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workdir = Path(tempfile.mkdtemp(prefix='bookstack-bench-'))
+    results_dir = workdir / 'audit-results'
+    native = case == 'audit (native)'
+    # The native case serves the inventory from fake APIs and starts with no results files
+    inventory = generate_audit_data(workdir / 'inventory' if native else results_dir, scale,
+                                    k3s_format=options['k3s_format'])
+    sources: List[FakeInventoryAPI] = []
+    if native:
+        sources = [
+            FakeProxmox(inventory['proxmox-nodes'], inventory['proxmox-vms'], latency=options['latency']).start(),
+            FakeKubernetes(inventory, latency=options['latency']).start(),
+        ]
+
+    fakes = [
+        FakeBookStack(
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            rate_limit=options['rate_limit']
+        ).start()
+        for _ in range(2 if 'standby' in options['targets'] else 1)
+    ]
+    try:
+        config_path = write_config(workdir, results_dir, fakes[0].url, options['concurrency'],
+                                   native_urls=[source.url for source in sources],
+                                   rate_limit=options['rate_limit'],
+                                   standby_url=fakes[-1].url, targets=options['targets'],
+                                   render_workers=options['render_workers'])
+        updater = bookstack_updater.BookStackUpdater(str(config_path), use_cache=options['cache'])
+
+        if native:
+            def work():
+                updater.run_audit()
+                context = updater.build_context()
+                return {key: context[key] for key in context}
+        elif case.startswith('update_docs'):
+            if case == 'update_docs (no-op)':
+                updater.update_docs()
+                updater = bookstack_updater.BookStackUpdater(str(config_path), use_cache=options['cache'])
+                updater.full = options['full']
+                for fake in fakes:
+                    fake.reset_counters()
+            work: Callable[[], Any] = updater.update_docs
+        elif case == 'build_context':
+            def work():
+                context = updater.build_context()
+                return {key: context[key] for key in context}
+        else:
+            work = getattr(updater.parser, case)
+
+        start = time.perf_counter()
+        result = work()
+        elapsed = time.perf_counter() - start
+        updater.close()
+    finally:
+        for fake in fakes:
+            fake.stop()
+        for source in sources:
+            source.stop()
+
+    return {
+        'case': case,
+        'scale': scale,
+        'seconds': elapsed,
+        'requests': sum(server.request_count for server in fakes + sources),
+        'bytes_sent': sum(fake.bytes_in for fake in fakes),
+        'bytes_received': sum(fake.bytes_out for fake in fakes),
+        # ru_maxrss is KiB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stats': result if isinstance(result, dict) and 'errors' in result else None,
+    }
+
+
+def run_benchmarks(scales: List[int], cases: List[str], options: Dict[str, Any]) -> List[Dict]:
+    """Run every case at every scale, each in its own process for a clean peak RSS"""
+    results = []
+    for scale in scales:
+        for case in cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('fork')) as pool:
+                results.append(pool.submit(_run_case, case, scale, options).result())
+    return results
+
+
+def print_report(results: List[Dict]):
+    header = f"{'case':<26} {'scale':>5} {'wall ms':>10} {'reqs':>6} {'sent KB':>9} {'recv KB':>9} {'peak RSS MB':>12}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['case']:<26} {r['scale']:>5} {r['seconds'] * 1000:>10.1f} {r['requests']:>6} "
+              f"{r['bytes_sent'] / 1024:>9.1f} {r['bytes_received'] / 1024:>9.1f} {r['peak_rss_mb']:>12.1f}")
+        if r['stats']:
+            print(f"{'':<26} {'':>5} {r['stats']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BookStack Updater Benchmarks')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100],
+                        help='Multiples of the real cluster size (default: 1 10 100)')
+    parser.add_argument('--case', nargs='+',
+                        default=['update_docs', 'update_docs (no-op)', 'build_context', 'audit (native)'] + PARSER_METHODS,
+                        help='Cases to run (default: all)')
+    parser.add_argument('--latency', type=float, default=0.002, help='Fake API latency per request (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered 429')
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help='Fake API requests allowed per minute, like API_REQUESTS_PER_MIN (default: unlimited)')
+    parser.add_argument('--concurrency', '-j', type=int, default=4, help='Updater sync concurrency')
+    parser.add_argument('--render-workers', type=int, default=0,
+                        help='Updater render processes (default: 0, render on the sync threads)')
+    parser.add_argument('--targets', nargs='+', choices=['bookstack', 'standby', 'filesystem'],
+                        default=['bookstack'],
+                        help='Publish targets; standby is a second fake BookStack (default: bookstack)')
+    parser.add_argument('--k3s-format', choices=['txt', 'json'], default='txt',
+                        help='Synthetic k3s results as kubectl tables or JSON lists')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the updater parse/template caches')
+    parser.add_argument('--full', action='store_true',
+                        help='Render every page in the no-op case instead of skipping unchanged inputs')
+    parser.add_argument('--json', metavar='FILE', help='Also write raw results as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    options = {
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'throttle_rate': args.throttle_rate,
+        'rate_limit': args.rate_limit,
+        'concurrency': args.concurrency,
+        'targets': args.targets,
+        'render_workers': args.render_workers,
+        'cache': not args.no_cache,
+        'full': args.full,
+        'k3s_format': args.k3s_format,
+    }
+    results = run_benchmarks(args.scale, args.case, options)
+    print_report(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,21 +2,39 @@
 """
 BookStack Auto-Updater for Homelab Documentation
 Reads audit data and updates BookStack via API
+
+requests, yaml and jinja2 are imported where they are first needed so that
+short-lived runs (e.g. --audit only) don't pay for them.
 """
 
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import argparse
+import bisect
+import functools
+import hashlib
 import json
 import logging
+import math
 import os
+import pickle
+import re
+import signal
+import sqlite3
 import subprocess
 import sys
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
 from datetime import datetime
+from functools import cached_property
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-
-import requests
-import yaml
-from jinja2 import Environment, FileSystemLoader
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 # Setup logging
 logging.basicConfig(
@@ -25,27 +43,547 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DEFAULT_CACHE_DIR = '~/.cache/bookstack-updater'
+
+# Context fields that change on every run without the page itself changing,
+# mapped to a pattern matching the line the templates render them on, with
+# the value between groups 1 and 2 (other timestamps in a page are data)
+VOLATILE_FIELDS = {
+    'updated_at': re.compile(r'^(\*Last updated: )\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\*)$',
+                             re.MULTILINE),
+}
+
+
+class Timings:
+    """Wall-clock durations of startup and run phases, reported by --timings"""
+    
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+    
+    def record(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+    
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+    
+    def report(self):
+        """Log every recorded phase"""
+        logger.info("Timings:")
+        for name, seconds in self.phases:
+            logger.info(f"  {name:<24} {seconds * 1000:9.1f} ms")
+
+
+timings = Timings()
+timings.record('module imports', time.perf_counter() - _IMPORT_STARTED)
+
+
+class RunMetrics:
+    """Prometheus metrics for updater runs
+    
+    Always collected in-process (it is only counters and sums) and exported
+    in the text exposition format, either to a node_exporter textfile
+    collector file or from a /metrics endpoint in --watch mode.
+    Phase durations accumulate across worker threads, so parse and render
+    are CPU-side totals while audit and sync are wall time.
+    """
+    
+    PREFIX = 'bookstack_updater'
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phase_seconds: Dict[str, float] = {}
+        self.pages: Dict[str, int] = {}
+        self.target_pages: Dict[Tuple[str, str], int] = {}
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.latency: Dict[Tuple[str, str], List[float]] = {}
+        self.bytes_sent = 0
+        self.throttled = 0
+        self.request_rate: Optional[float] = None
+        self.outbox_pending: Optional[int] = None
+        self.last_run: Optional[float] = None
+        self.last_run_success = 0
+    
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+    
+    def add_phase(self, name: str, seconds: float):
+        """Add time spent in a phase, e.g. as measured by a worker process"""
+        with self._lock:
+            self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+    
+    def observe_request(self, method: str, endpoint: str, status: str,
+                        seconds: float, bytes_sent: int):
+        """Record one API call; ids in the endpoint are collapsed to :id"""
+        endpoint = re.sub(r'/\d+', '/:id', endpoint)
+        with self._lock:
+            key = (method, endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            # [bucket counts..., sum, count]
+            hist = self.latency.setdefault(
+                (method, endpoint), [0] * len(self.LATENCY_BUCKETS) + [0.0, 0]
+            )
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+            self.bytes_sent += bytes_sent
+    
+    def record_run(self, stats: Dict[str, int]):
+        """Record the page results of a finished update_docs run"""
+        with self._lock:
+            for result in ('created', 'updated', 'unchanged', 'skipped', 'deleted', 'errors'):
+                self.pages[result] = self.pages.get(result, 0) + stats.get(result, 0)
+                for target, target_stats in stats.get('targets', {}).items():
+                    key = (target, result)
+                    self.target_pages[key] = self.target_pages.get(key, 0) + target_stats.get(result, 0)
+            self.throttled += stats.get('throttled', 0)
+            if 'requests_per_second' in stats:
+                self.request_rate = stats['requests_per_second']
+            if 'pending' in stats:
+                self.outbox_pending = stats['pending']
+            self.last_run = time.time()
+            self.last_run_success = int(stats.get('errors', 0) == 0)
+    
+    @staticmethod
+    def _labels(**labels) -> str:
+        def escape(value) -> str:
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+    
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        p = self.PREFIX
+        lines = []
+        with self._lock:
+            lines += [f'# HELP {p}_phase_seconds_total Time spent per phase (audit, parse, render, sync).',
+                      f'# TYPE {p}_phase_seconds_total counter']
+            for phase, seconds in sorted(self.phase_seconds.items()):
+                lines.append(f'{p}_phase_seconds_total{self._labels(phase=phase)} {seconds:.6f}')
+            
+            lines += [f'# HELP {p}_pages_total Pages synced, by result.',
+                      f'# TYPE {p}_pages_total counter']
+            for result, count in sorted(self.pages.items()):
+                lines.append(f'{p}_pages_total{self._labels(result=result)} {count}')
+            
+            lines += [f'# HELP {p}_target_pages_total Pages published, by target and result.',
+                      f'# TYPE {p}_target_pages_total counter']
+            for (target, result), count in sorted(self.target_pages.items()):
+                lines.append(f'{p}_target_pages_total{self._labels(target=target, result=result)} {count}')
+            
+            lines += [f'# HELP {p}_api_requests_total BookStack API requests.',
+                      f'# TYPE {p}_api_requests_total counter']
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                labels = self._labels(method=method, endpoint=endpoint, code=status)
+                lines.append(f'{p}_api_requests_total{labels} {count}')
+            
+            lines += [f'# HELP {p}_api_request_duration_seconds BookStack API request latency.',
+                      f'# TYPE {p}_api_request_duration_seconds histogram']
+            for (method, endpoint), hist in sorted(self.latency.items()):
+                for bound, count in zip(self.LATENCY_BUCKETS + ('+Inf',), hist[:-2] + [hist[-1]]):
+                    labels = self._labels(method=method, endpoint=endpoint, le=bound)
+                    lines.append(f'{p}_api_request_duration_seconds_bucket{labels} {count}')
+                labels = self._labels(method=method, endpoint=endpoint)
+                lines.append(f'{p}_api_request_duration_seconds_sum{labels} {hist[-2]:.6f}')
+                lines.append(f'{p}_api_request_duration_seconds_count{labels} {hist[-1]}')
+            
+            lines += [f'# HELP {p}_api_bytes_sent_total Request body bytes sent to BookStack.',
+                      f'# TYPE {p}_api_bytes_sent_total counter',
+                      f'{p}_api_bytes_sent_total {self.bytes_sent}',
+                      f'# HELP {p}_api_throttled_total Requests answered 429 and retried after Retry-After.',
+                      f'# TYPE {p}_api_throttled_total counter',
+                      f'{p}_api_throttled_total {self.throttled}']
+            if self.request_rate is not None:
+                lines += [f'# HELP {p}_api_request_rate Requests per second achieved by the last sync.',
+                          f'# TYPE {p}_api_request_rate gauge',
+                          f'{p}_api_request_rate {self.request_rate}']
+            if self.outbox_pending is not None:
+                lines += [f'# HELP {p}_outbox_pending Page writes waiting in the outbox.',
+                          f'# TYPE {p}_outbox_pending gauge',
+                          f'{p}_outbox_pending {self.outbox_pending}']
+            
+            if self.last_run is not None:
+                lines += [f'# HELP {p}_last_run_timestamp_seconds When the last sync finished.',
+                          f'# TYPE {p}_last_run_timestamp_seconds gauge',
+                          f'{p}_last_run_timestamp_seconds {self.last_run:.3f}',
+                          f'# HELP {p}_last_run_success Whether the last sync had no errors.',
+                          f'# TYPE {p}_last_run_success gauge',
+                          f'{p}_last_run_success {self.last_run_success}']
+        return '\n'.join(lines) + '\n'
+    
+    def write_textfile(self, path: str):
+        """Write metrics atomically for node_exporter's textfile collector"""
+        target = Path(path).expanduser()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f'.{target.name}.{os.getpid()}')
+        tmp.write_text(self.render())
+        os.replace(tmp, target)
+    
+    def serve(self, port: int, address: str = ''):
+        """Serve /metrics from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        
+        metrics = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer((address, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on :{port}/metrics")
+        return server
+
+
+metrics = RunMetrics()
+
+
+class PhaseProfiler:
+    """Per-phase cProfile stats plus sampled stacks for flamegraphs
+    
+    Phases nest: entering one pauses the enclosing phase, so time lands on
+    the innermost phase only. cProfile only sees the thread that enabled it,
+    so --profile runs the sync serially on the main thread. A sampler thread
+    records that thread's stack every `interval` seconds, written out in the
+    collapsed format flamegraph.pl and speedscope read.
+    """
+    
+    def __init__(self, output_dir: Path, interval: float = 0.001):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.profiles: Dict[str, Any] = {}
+        self.stacks: Dict[str, Dict[str, int]] = {}
+        self._active: List[str] = []
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+    
+    @contextmanager
+    def phase(self, name: str):
+        import cProfile
+        
+        if threading.get_ident() != self._thread_id:
+            yield
+            return
+        if self._active:
+            self.profiles[self._active[-1]].disable()
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        self._active.append(name)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._active.pop()
+            if self._active:
+                self.profiles[self._active[-1]].enable()
+    
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            if not self._active:
+                continue
+            phase = self._active[-1]
+            frame = sys._current_frames().get(self._thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack = ';'.join(reversed(frames))
+            counts = self.stacks.setdefault(phase, {})
+            counts[stack] = counts.get(stack, 0) + 1
+    
+    @staticmethod
+    def _filename(phase: str) -> str:
+        return re.sub(r'[^\w.-]+', '_', phase).strip('_')
+    
+    def finish(self, top: int = 25):
+        """Write per-phase stats and stacks, and log the hottest functions"""
+        import io
+        import pstats
+        
+        self._stop.set()
+        self._sampler.join()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        
+        combined = []
+        for phase, profile in self.profiles.items():
+            name = self._filename(phase)
+            profile.dump_stats(str(self.output_dir / f'{name}.pstats'))
+            lines = [f'{stack} {count}' for stack, count in self.stacks.get(phase, {}).items()]
+            (self.output_dir / f'{name}.collapsed').write_text('\n'.join(lines) + '\n')
+            combined += [f'{phase};{line}' for line in lines]
+        # One file with the phase as root frame, for a single whole-run flamegraph
+        (self.output_dir / 'all.collapsed').write_text('\n'.join(combined) + '\n')
+        
+        if not self.profiles:
+            return
+        out = io.StringIO()
+        stats = pstats.Stats(*self.profiles.values(), stream=out)
+        stats.sort_stats('tottime').print_stats(top)
+        logger.info(f"Top {top} functions by own time (profiles in {self.output_dir}):\n{out.getvalue()}")
+
+
+# Set by --profile
+profiler: Optional[PhaseProfiler] = None
+
+
+def profiled(phase: str):
+    """Attribute a block to a profiling phase when --profile is active"""
+    return profiler.phase(phase) if profiler else nullcontext()
+
+
+class InlineExecutor(Executor):
+    """Executor that runs tasks immediately on the calling thread"""
+    
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def content_hash(markdown: str) -> str:
+    """Canonical hash of page markdown with volatile fields masked out"""
+    canonical = markdown.replace('\r\n', '\n').strip()
+    for field, pattern in VOLATILE_FIELDS.items():
+        canonical = pattern.sub(f'\\g<1>{{{{ {field} }}}}\\g<2>', canonical)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def pooled_session(pool_size: int, retries: int, backoff_factor: float,
+                   methods=frozenset(['GET']), statuses=(502, 503, 504), retry_after: bool = True):
+    """requests Session with a keep-alive pool and retries on transient errors
+    
+    With `retry_after=False`, urllib3 leaves responses carrying Retry-After
+    (429s) to the caller instead of sleeping on them itself.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=statuses,
+        allowed_methods=methods,
+        respect_retry_after_header=retry_after,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RateLimiter:
+    """Client-side token bucket following BookStack's X-RateLimit-* headers and 429s"""
+    
+    def __init__(self, per_minute: float = 180):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.requests = 0
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self.tokens = min(self.per_minute, self.tokens + elapsed * self.per_minute / 60)
+    
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    if self.per_minute <= 0:
+                        self.requests += 1
+                        return
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.requests += 1
+                        return
+                    wait = (1 - self.tokens) * 60 / self.per_minute
+                else:
+                    wait = self._paused_until - now
+            time.sleep(wait)
+    
+    def observe(self, headers: Mapping[str, str]):
+        """Adapt to the X-RateLimit-* headers of a response"""
+        limit = headers.get('X-RateLimit-Limit')
+        remaining = headers.get('X-RateLimit-Remaining')
+        with self._lock:
+            if limit and limit.isdigit() and int(limit) != self.per_minute:
+                logger.debug(f"Server rate limit is {limit}/min, adapting")
+                self.per_minute = int(limit)
+            if remaining and remaining.isdigit():
+                self._refill(time.monotonic())
+                self.tokens = min(self.tokens, int(remaining))
+    
+    def backoff(self, retry_after: float):
+        """Pause all callers after a 429"""
+        with self._lock:
+            self.throttled += 1
+            self.tokens = 0.0
+            self._updated = time.monotonic()
+            self._paused_until = max(self._paused_until, self._updated + retry_after)
+
 
 class BookStackAPI:
     """BookStack API client"""
     
-    def __init__(self, url: str, token_id: str, token_secret: str):
+    # Verbs that are safe to replay after a dropped connection or 5xx.
+    # POST is excluded so a retried create can never duplicate a page.
+    RETRY_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+    RETRY_STATUSES = (502, 503, 504)
+    
+    def __init__(self, url: str, token_id: str, token_secret: str,
+                 pool_size: int = 10, timeout: Tuple[float, float] = (5, 30),
+                 retries: int = 3, backoff_factor: float = 0.5, page_size: int = 100,
+                 rate_limit: float = 180, throttle_deadline: float = 120):
         self.base_url = url.rstrip('/')
         self.headers = {
             'Authorization': f'Token {token_id}:{token_secret}',
             'Content-Type': 'application/json'
         }
+        self.timeout = timeout
+        self.page_size = page_size
+        self.limiter = RateLimiter(rate_limit)
+        self.throttle_deadline = throttle_deadline
+        
+        # One keep-alive pool for the whole run instead of a handshake per call.
+        # 429s are left to _request, so the limiter pauses every worker on them.
+        self.session = pooled_session(
+            pool_size, retries, backoff_factor,
+            methods=self.RETRY_METHODS, statuses=self.RETRY_STATUSES, retry_after=False
+        )
+        self.session.headers.update(self.headers)
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> 'BookStackAPI':
+        """Build a client from the `bookstack:` config section"""
+        return cls(
+            config['url'],
+            config['api_token_id'],
+            config['api_token_secret'],
+            pool_size=config.get('pool_size', 10),
+            timeout=(config.get('connect_timeout', 5), config.get('read_timeout', 30)),
+            retries=config.get('retries', 3),
+            backoff_factor=config.get('backoff_factor', 0.5),
+            page_size=config.get('page_size', 100),
+            rate_limit=config.get('rate_limit', 180),
+            throttle_deadline=config.get('throttle_deadline', 120)
+        )
+    
+    def close(self):
+        """Release pooled connections"""
+        self.session.close()
     
     def _request(self, method: str, endpoint: str, **kwargs) -> Dict:
-        """Make API request"""
+        """Make API request
+        
+        Requests wait for the rate limiter. A 429 is retried after its
+        Retry-After until `throttle_deadline` seconds have passed; that is
+        safe even for POST, as a throttled request was never processed.
+        """
         url = f"{self.base_url}/api/{endpoint}"
-        resp = requests.request(method, url, headers=self.headers, **kwargs)
+        kwargs.setdefault('timeout', self.timeout)
+        deadline = time.monotonic() + self.throttle_deadline
+        while True:
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                with profiled(f"api {method} " + re.sub(r'/\d+', '/:id', endpoint)):
+                    resp = self.session.request(method, url, **kwargs)
+            except Exception:
+                metrics.observe_request(method, endpoint, 'error', time.perf_counter() - start, 0)
+                raise
+            metrics.observe_request(
+                method, endpoint, str(resp.status_code),
+                time.perf_counter() - start, len(resp.request.body or b'')
+            )
+            self.limiter.observe(resp.headers)
+            if resp.status_code != 429:
+                break
+            retry_after = self._retry_after(resp.headers)
+            if time.monotonic() + retry_after > deadline:
+                break
+            logger.debug(f"Throttled on {method} {endpoint}, retrying in {retry_after:.1f}s")
+            self.limiter.backoff(retry_after)
         resp.raise_for_status()
         return resp.json() if resp.text else {}
     
+    @staticmethod
+    def _retry_after(headers: Mapping[str, str]) -> float:
+        """Seconds to wait from Retry-After (or X-RateLimit-Reset), default 1"""
+        value = headers.get('Retry-After')
+        if value and value.strip().isdigit():
+            return float(value)
+        reset = headers.get('X-RateLimit-Reset')
+        if reset and reset.isdigit():
+            return max(0.0, int(reset) - time.time())
+        return 1.0
+    
+    def iter_list(self, endpoint: str, filters: Optional[Dict[str, Any]] = None,
+                  fields: Optional[Tuple[str, ...]] = None,
+                  page_size: Optional[int] = None) -> Iterator[Dict]:
+        """Stream every item of a paginated listing endpoint
+        
+        `filters` are sent as server-side `filter[field]=value` parameters.
+        BookStack has no sparse fieldsets, so `fields` projects each item as it
+        streams past instead of keeping whole records around.
+        """
+        params = {f'filter[{key}]': value for key, value in (filters or {}).items()}
+        params['count'] = page_size or self.page_size
+        params['sort'] = '+id'  # Stable order so items cannot shift between pages
+        offset = 0
+        while True:
+            params['offset'] = offset
+            resp = self._request('GET', endpoint, params=params)
+            data = resp.get('data', [])
+            for item in data:
+                yield {key: item.get(key) for key in fields} if fields else item
+            offset += len(data)
+            if not data or offset >= resp.get('total', 0):
+                return
+    
     def get_books(self) -> List[Dict]:
         """Get all books"""
-        return self._request('GET', 'books')['data']
+        return list(self.iter_list('books'))
     
     def create_book(self, name: str, description: str = "") -> Dict:
         """Create a new book"""
@@ -68,10 +606,12 @@ class BookStackAPI:
     
     def get_pages(self, chapter_id: int = None) -> List[Dict]:
         """Get pages, optionally filtered by chapter"""
-        pages = self._request('GET', 'pages')['data']
-        if chapter_id:
-            pages = [p for p in pages if p.get('chapter_id') == chapter_id]
-        return pages
+        filters = {'chapter_id': chapter_id} if chapter_id else None
+        return list(self.iter_list('pages', filters=filters))
+    
+    def get_page(self, page_id: int) -> Dict:
+        """Get a single page including its markdown"""
+        return self._request('GET', f'pages/{page_id}')
     
     def create_page(self, chapter_id: int, name: str, markdown: str) -> Dict:
         """Create a new page"""
@@ -88,6 +628,10 @@ class BookStackAPI:
             'markdown': markdown
         })
     
+    def delete_page(self, page_id: int):
+        """Delete a page (BookStack moves it to the recycle bin)"""
+        self._request('DELETE', f'pages/{page_id}')
+    
     def find_or_create_book(self, name: str) -> Dict:
         """Find existing book or create new one"""
         books = self.get_books()
@@ -109,11 +653,1531 @@ class BookStackAPI:
         return self.create_chapter(book_id, name)
 
 
+class BufferedLog:
+    """Log records collected in a worker thread, emitted later in order"""
+    
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self.records: List[Tuple[int, str]] = []
+    
+    def info(self, msg: str):
+        self.records.append((logging.INFO, self.prefix + msg))
+    
+    def warning(self, msg: str):
+        self.records.append((logging.WARNING, self.prefix + msg))
+    
+    def error(self, msg: str):
+        self.records.append((logging.ERROR, self.prefix + msg))
+    
+    def flush(self):
+        for level, msg in self.records:
+            logger.log(level, msg)
+        self.records = []
+
+
+class RemoteIndex:
+    """Case-insensitive name -> id map of the remote book/chapter/page tree
+    
+    Built once per run from the paginated listings so that lookups cost no
+    requests. Keys are lowercased name tuples: (book,), (book, chapter) and
+    (book, chapter, page). Creates are recorded with add() to keep it current.
+    """
+    
+    def __init__(self):
+        self._ids: Dict[Tuple[str, ...], int] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(names: Tuple[str, ...]) -> Tuple[str, ...]:
+        return tuple(name.lower() for name in names)
+    
+    @classmethod
+    def load(cls, api: BookStackAPI) -> 'RemoteIndex':
+        """Build the index from the books, chapters and pages listings"""
+        index = cls()
+        book_names = {}
+        for book in api.iter_list('books', fields=('id', 'name')):
+            book_names[book['id']] = book['name']
+            index.add(book['id'], book['name'])
+        
+        chapter_names = {}
+        for chapter in api.iter_list('chapters', fields=('id', 'book_id', 'name')):
+            book_name = book_names.get(chapter['book_id'])
+            if book_name is None:
+                continue
+            chapter_names[chapter['id']] = (book_name, chapter['name'])
+            index.add(chapter['id'], book_name, chapter['name'])
+        
+        for page in api.iter_list('pages', fields=('id', 'chapter_id', 'name')):
+            # Pages sitting directly in a book are not addressable from config
+            parent = chapter_names.get(page.get('chapter_id'))
+            if parent is None:
+                continue
+            index.add(page['id'], *parent, page['name'])
+        
+        logger.debug(f"Indexed {len(index)} remote books, chapters and pages")
+        return index
+    
+    def get(self, *names: str) -> Optional[int]:
+        """Look up the id for a (book[, chapter[, page]]) name path"""
+        return self._ids.get(self._key(names))
+    
+    def add(self, item_id: int, *names: str):
+        """Record an item; the first item seen for a name wins"""
+        key = self._key(names)
+        with self._lock:
+            if key not in self._ids:
+                self._ids[key] = item_id
+    
+    def remove(self, *names: str):
+        """Forget a deleted item"""
+        key = self._key(names)
+        with self._lock:
+            self._ids.pop(key, None)
+    
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def store_key(*names: str) -> str:
+    """One string key for a name path such as (book, chapter, page)"""
+    return '\x1f'.join(names)
+
+
+class JsonStore(ABC):
+    """Local state kept in a JSON file, read on creation and saved atomically
+    
+    Subclasses set up their empty state before calling __init__, and
+    implement _load() and _dump(). An unreadable file is ignored.
+    """
+    
+    # Name used in the warning about an unreadable file
+    NAME = 'store'
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        if path.exists():
+            try:
+                self._load(json.loads(path.read_text()))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable {self.NAME} {path}: {e}")
+    
+    @abstractmethod
+    def _load(self, data: Any):
+        """Adopt the data read from the file"""
+    
+    @abstractmethod
+    def _dump(self) -> Any:
+        """The data to write, called with the lock held"""
+    
+    def save(self):
+        """Write the store atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with self._lock:
+            data = json.dumps(self._dump(), indent=2, sort_keys=True)
+        tmp.write_text(data)
+        os.replace(tmp, self.path)
+
+
+class PageHashStore(JsonStore):
+    """Content hashes of the markdown last pushed, keyed by page id (or path)"""
+    
+    NAME = 'page hash store'
+    
+    def __init__(self, path: Path):
+        self._hashes: Dict[str, str] = {}
+        super().__init__(path)
+    
+    def _load(self, data: Dict[str, str]):
+        self._hashes = data
+    
+    def _dump(self) -> Dict[str, str]:
+        return self._hashes
+    
+    def get(self, page_id: int) -> Optional[str]:
+        return self._hashes.get(str(page_id))
+    
+    def set(self, page_id: int, digest: str):
+        with self._lock:
+            self._hashes[str(page_id)] = digest
+    
+    def discard(self, page_id: int):
+        with self._lock:
+            self._hashes.pop(str(page_id), None)
+
+
+class ShardStore(JsonStore):
+    """Names of the shard pages published per target and sharded page"""
+    
+    NAME = 'shard store'
+    
+    def __init__(self, path: Path):
+        self._shards: Dict[str, List[str]] = {}
+        super().__init__(path)
+    
+    def _load(self, data: Dict[str, List[str]]):
+        self._shards = data
+    
+    def _dump(self) -> Dict[str, List[str]]:
+        return self._shards
+    
+    def get(self, target: str, book: str, chapter: str, page: str) -> List[str]:
+        with self._lock:
+            return list(self._shards.get(store_key(target, book, chapter, page), []))
+    
+    def set(self, target: str, book: str, chapter: str, page: str, names: List[str]):
+        with self._lock:
+            self._shards[store_key(target, book, chapter, page)] = list(dict.fromkeys(names))
+    
+    def discard(self, target: str, book: str, chapter: str, page: str, name: str):
+        with self._lock:
+            names = self._shards.get(store_key(target, book, chapter, page), [])
+            if name in names:
+                names.remove(name)
+
+
+class Outbox:
+    """Durable queue of page writes waiting to be pushed to BookStack, one entry per page"""
+    
+    COLUMNS = ('key', 'book', 'chapter', 'name', 'action', 'page_id', 'markdown', 'digest',
+               'queued_at', 'attempts', 'last_error')
+    
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS pending ('
+            ' key TEXT PRIMARY KEY, book TEXT NOT NULL, chapter TEXT NOT NULL, name TEXT NOT NULL,'
+            ' action TEXT NOT NULL, page_id INTEGER, markdown TEXT, digest TEXT,'
+            ' queued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT)'
+        )
+        # Entries given up on after too many rejected attempts
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS dead ('
+            ' key TEXT PRIMARY KEY, book TEXT NOT NULL, chapter TEXT NOT NULL, name TEXT NOT NULL,'
+            ' action TEXT NOT NULL, page_id INTEGER, markdown TEXT, digest TEXT,'
+            ' queued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT)'
+        )
+    
+    @staticmethod
+    def _key(book: str, chapter: str, name: str) -> str:
+        return store_key(book.lower(), chapter.lower(), name.lower())
+    
+    def _upsert(self, book: str, chapter: str, name: str, action: str,
+                page_id: Optional[int], markdown: Optional[str], digest: Optional[str]):
+        # Re-queueing an identical entry keeps its place and attempt count
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM dead WHERE key = ?', (self._key(book, chapter, name),))
+            self._db.execute(
+                'INSERT INTO pending (key, book, chapter, name, action, page_id, markdown, digest,'
+                ' queued_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET book = excluded.book, chapter = excluded.chapter,'
+                ' name = excluded.name, action = excluded.action, page_id = excluded.page_id,'
+                ' markdown = excluded.markdown, digest = excluded.digest,'
+                ' queued_at = excluded.queued_at, attempts = 0, last_error = NULL'
+                ' WHERE pending.action IS NOT excluded.action OR pending.digest IS NOT excluded.digest'
+                ' OR pending.page_id IS NOT excluded.page_id',
+                (self._key(book, chapter, name), book, chapter, name, action, page_id,
+                 markdown, digest, time.time())
+            )
+    
+    def put(self, book: str, chapter: str, name: str, markdown: str, digest: str):
+        """Queue a page write, replacing any pending entry for the page"""
+        self._upsert(book, chapter, name, 'write', None, markdown, digest)
+    
+    def put_delete(self, book: str, chapter: str, name: str, page_id: int):
+        """Queue a page deletion, replacing any pending entry for the page"""
+        self._upsert(book, chapter, name, 'delete', page_id, None, None)
+    
+    def discard(self, book: str, chapter: str, name: str):
+        """Drop the pending entry for a page, if any"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM pending WHERE key = ?', (self._key(book, chapter, name),))
+    
+    def done(self, entry: Dict[str, Any]):
+        """Remove a pushed entry, unless a newer one replaced it meanwhile"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM pending WHERE key = ? AND queued_at = ?',
+                             (entry['key'], entry['queued_at']))
+    
+    def fail(self, entry: Dict[str, Any], error: str, attempt: bool = True):
+        """Keep a failed entry for the next flush; an outage passes `attempt=False`"""
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE pending SET attempts = attempts + ?, last_error = ?'
+                ' WHERE key = ? AND queued_at = ?',
+                (int(attempt), error, entry['key'], entry['queued_at'])
+            )
+    
+    def bury(self, entry: Dict[str, Any], error: str):
+        """Move an entry that keeps being rejected from the queue to the dead letters"""
+        columns = ', '.join(self.COLUMNS)
+        with self._lock, self._db:
+            self._db.execute(
+                f'INSERT OR REPLACE INTO dead ({columns}) SELECT {columns} FROM pending'
+                ' WHERE key = ? AND queued_at = ?',
+                (entry['key'], entry['queued_at'])
+            )
+            self._db.execute(
+                'UPDATE dead SET attempts = attempts + 1, last_error = ? WHERE key = ?',
+                (error, entry['key'])
+            )
+            self._db.execute('DELETE FROM pending WHERE key = ? AND queued_at = ?',
+                             (entry['key'], entry['queued_at']))
+    
+    def buried(self, book: str, chapter: str, name: str, digest: Optional[str]) -> Optional[str]:
+        """The error a dead entry for this page and content was given up on, if any"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT last_error FROM dead WHERE key = ? AND digest IS ?',
+                (self._key(book, chapter, name), digest)
+            ).fetchone()
+        return None if row is None else row[0] or ''
+    
+    def batches(self, size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Pending entries, oldest first, `size` at a time"""
+        # Paged by (queued_at, key), not offset, so entries left pending aren't returned twice
+        after = (-1.0, '')
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    f'SELECT {", ".join(self.COLUMNS)} FROM pending'
+                    ' WHERE (queued_at, key) > (?, ?) ORDER BY queued_at, key LIMIT ?',
+                    (*after, size)
+                ).fetchall()
+            if not rows:
+                return
+            batch = [dict(zip(self.COLUMNS, row)) for row in rows]
+            yield batch
+            after = (batch[-1]['queued_at'], batch[-1]['key'])
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+    
+    def close(self):
+        self._db.close()
+
+
+def slugify(name: str) -> str:
+    """Lowercase, hyphen-separated file name for a book, chapter or page"""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'untitled'
+
+
+class Publisher(ABC):
+    """A target that rendered pages are published to
+    
+    Every page is rendered once and handed to each target, which does its
+    own change detection against what it last accepted. A target's work
+    runs on its own pool of `concurrency` threads, so a slow mirror does
+    not hold up the others. publish() and delete() return the stats key
+    for the page; raising counts the page as an error for that target only.
+    """
+    
+    # Whether change detection checks the target's current content
+    verify_remote = False
+    
+    def __init__(self, name: str, state_path: Path, concurrency: int = 4):
+        self.name = name
+        self.concurrency = concurrency
+        self.dry_run = False
+        self.hashes = PageHashStore(state_path)
+    
+    def new_stats(self) -> Dict[str, int]:
+        return {'created': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'errors': 0}
+    
+    def start(self):
+        """Prepare for a run; raising leaves the target out of it"""
+    
+    @abstractmethod
+    def publish(self, book: str, chapter: str, name: str, content: str, digest: str,
+                log: BufferedLog) -> Optional[str]:
+        """Write a rendered page unless the target already has this content"""
+    
+    @abstractmethod
+    def has_page(self, book: str, chapter: str, name: str) -> bool:
+        """Whether the target still holds a page it was given, checked without requests"""
+    
+    @property
+    def available(self) -> bool:
+        """Whether has_page() can be trusted this run"""
+        return True
+    
+    @abstractmethod
+    def delete(self, book: str, chapter: str, name: str, log: BufferedLog) -> Optional[str]:
+        """Remove a page whose shard no longer exists"""
+    
+    def finish(self, stats: Dict[str, Any]):
+        """Complete a run (flush queued writes, save state) and add to its stats"""
+        if not self.dry_run:
+            try:
+                self.hashes.save()
+            except OSError as e:
+                logger.warning(f"Could not save page hashes of {self.name}: {e}")
+    
+    def close(self):
+        pass
+
+
+class PathPublisher(Publisher):
+    """A target that can't be listed remotely, tracked by page path
+    
+    What it last accepted is kept in the hash store keyed by page path.
+    Subclasses implement _write() and _remove(), and _exists() if they
+    can tell whether a page is still there.
+    """
+    
+    def publish(self, book: str, chapter: str, name: str, content: str, digest: str,
+                log: BufferedLog) -> Optional[str]:
+        """Write a rendered page unless the target already has this content"""
+        key = store_key(book, chapter, name)
+        previous = self.hashes.get(key)
+        if previous == digest and self._exists(book, chapter, name):
+            log.info(f"Unchanged page: {name}")
+            return 'unchanged'
+        if self.dry_run:
+            log.info(f"Would {'update' if previous else 'create'} page: {name}")
+            return None
+        self._write(book, chapter, name, content, digest, previous is not None)
+        self.hashes.set(key, digest)
+        action = 'updated' if previous else 'created'
+        log.info(f"{action.capitalize()} page: {name}")
+        return action
+    
+    def has_page(self, book: str, chapter: str, name: str) -> bool:
+        """Whether the target still holds a page it was given, checked without requests"""
+        return (self.hashes.get(store_key(book, chapter, name)) is not None
+                and self._exists(book, chapter, name))
+    
+    def delete(self, book: str, chapter: str, name: str, log: BufferedLog) -> Optional[str]:
+        """Remove a page whose shard no longer exists"""
+        if self.dry_run:
+            log.info(f"Would delete stale page: {name}")
+            return None
+        self._remove(book, chapter, name)
+        self.hashes.discard(store_key(book, chapter, name))
+        log.info(f"Deleted stale page: {name}")
+        return 'deleted'
+    
+    def _exists(self, book: str, chapter: str, name: str) -> bool:
+        return True
+    
+    @abstractmethod
+    def _write(self, book: str, chapter: str, name: str, content: str, digest: str,
+               replace: bool):
+        """Write a page's content, replacing an earlier version if `replace`"""
+    
+    @abstractmethod
+    def _remove(self, book: str, chapter: str, name: str):
+        """Remove a page"""
+
+
+class BookStackPublisher(Publisher):
+    """Publishes pages to a BookStack instance through its API
+    
+    Books and chapters are created on the first page written to them. Page
+    ids come from the RemoteIndex, built when the run starts, and the hash
+    store is keyed by page id. With an outbox, changed pages are committed
+    to it during the run and flushed when the run finishes.
+    """
+    
+    def __init__(self, name: str, config: Dict, state_path: Path, outbox_path: Path,
+                 concurrency: int = 4, verify_remote: bool = False, use_outbox: bool = False,
+                 flush_batch: int = 25, max_attempts: int = 5):
+        super().__init__(name, state_path, concurrency)
+        self.config = config
+        self.verify_remote = verify_remote
+        self.outbox_path = outbox_path
+        self.flush_batch = max(1, flush_batch)
+        self.max_attempts = max(1, max_attempts)
+        self.index: Optional[RemoteIndex] = None
+        self.outbox: Optional[Outbox] = self.open_outbox() if use_outbox else None
+        self._structure_lock = threading.Lock()
+        self._started = (time.monotonic(), 0, 0)
+    
+    @cached_property
+    def api(self) -> Optional[BookStackAPI]:
+        """BookStack client, created (and requests imported) on first use"""
+        if not (self.config['api_token_id'] and self.config['api_token_secret']):
+            logger.warning(f"BookStack API credentials not configured for {self.name}")
+            return None
+        with timings.phase('api client setup'):
+            return BookStackAPI.from_config(self.config)
+    
+    @property
+    def url(self) -> str:
+        return self.config['url']
+    
+    def open_outbox(self) -> Outbox:
+        """The durable outbox of pending page writes"""
+        return Outbox(self.outbox_path)
+    
+    def close(self):
+        """Release the HTTP pool and outbox, if they were opened"""
+        if self.__dict__.get('api'):
+            self.api.close()
+        if self.outbox is not None:
+            self.outbox.close()
+    
+    def new_stats(self) -> Dict[str, int]:
+        stats = super().new_stats()
+        if self.outbox is not None:
+            stats['queued'] = stats['dead'] = 0
+        return stats
+    
+    def start(self):
+        """Index the remote tree; with an outbox, an unreachable BookStack is not fatal"""
+        if not self.api:
+            raise RuntimeError("API not configured")
+        limiter = self.api.limiter
+        self._started = (time.monotonic(), limiter.requests, limiter.throttled)
+        try:
+            if self.index is None:
+                self.index = RemoteIndex.load(self.api)
+        except Exception as e:
+            if self.outbox is None:
+                raise RuntimeError(f"error indexing BookStack content: {e}") from e
+            logger.warning(f"BookStack {self.name} unavailable, queueing pages in the outbox: {e}")
+    
+    def _ensure_book(self, name: str, log: BufferedLog) -> Optional[int]:
+        """Resolve a book id from the index, creating the book if missing"""
+        book_id = self.index.get(name)
+        if book_id:
+            return book_id
+        if self.dry_run:
+            log.info(f"Would create book: {name}")
+            return None
+        log.info(f"Creating new book: {name}")
+        book_id = self.api.create_book(name)['id']
+        self.index.add(book_id, name)
+        return book_id
+    
+    def _ensure_chapter(self, book_id: Optional[int], book_name: str, name: str,
+                        log: BufferedLog) -> Optional[int]:
+        """Resolve a chapter id from the index, creating the chapter if missing"""
+        chapter_id = self.index.get(book_name, name)
+        if chapter_id:
+            return chapter_id
+        if self.dry_run or book_id is None:
+            log.info(f"Would create chapter: {name}")
+            return None
+        log.info(f"Creating new chapter: {name}")
+        chapter_id = self.api.create_chapter(book_id, name)['id']
+        self.index.add(chapter_id, book_name, name)
+        return chapter_id
+    
+    def _ensure_parents(self, book: str, chapter: str, log: BufferedLog) -> Optional[int]:
+        """The chapter id for a new page, creating its book and chapter if missing"""
+        # Serialized so pages of a new chapter don't each create it
+        with self._structure_lock:
+            book_id = self._ensure_book(book, log)
+            return self._ensure_chapter(book_id, book, chapter, log)
+    
+    def _is_unchanged(self, page_id: int, digest: str) -> bool:
+        """Check a rendered page against the last pushed (or remote) content"""
+        if self.verify_remote:
+            remote = self.api.get_page(page_id).get('markdown') or ''
+            if content_hash(remote) != digest:
+                return False
+            self.hashes.set(page_id, digest)
+            return True
+        return self.hashes.get(page_id) == digest
+    
+    def publish(self, book: str, chapter: str, name: str, content: str, digest: str,
+                log: BufferedLog) -> Optional[str]:
+        """Push a page if its content changed, or queue it in the outbox"""
+        existing_id = self.index.get(book, chapter, name) if self.index else None
+        if self.outbox is not None and not self.dry_run:
+            return self._queue_page(book, chapter, name, content, digest, existing_id, log)
+        if existing_id and self._is_unchanged(existing_id, digest):
+            log.info(f"Unchanged page: {name}")
+            return 'unchanged'
+        if self.dry_run:
+            if not existing_id and self.index is not None:
+                self._ensure_parents(book, chapter, log)
+            log.info(f"Would {'update' if existing_id else 'create'} page: {name}")
+            return None
+        if existing_id:
+            self.api.update_page(existing_id, name, content)
+            self.hashes.set(existing_id, digest)
+            log.info(f"Updated page: {name}")
+            return 'updated'
+        
+        chapter_id = self._ensure_parents(book, chapter, log)
+        page = self.api.create_page(chapter_id, name, content)
+        self.index.add(page['id'], book, chapter, name)
+        self.hashes.set(page['id'], digest)
+        log.info(f"Created page: {name}")
+        return 'created'
+    
+    def _queue_page(self, book: str, chapter: str, name: str, content: str, digest: str,
+                    existing_id: Optional[int], log: BufferedLog) -> str:
+        """Commit a rendered page to the outbox unless it matches the last push
+        
+        Only the local page hashes are checked here; `verify_remote` is
+        applied when the page is flushed. Content that was given up on
+        is not queued again and counts as an error.
+        """
+        if existing_id and self.hashes.get(existing_id) == digest:
+            # Also drops an older pending render of the page
+            self.outbox.discard(book, chapter, name)
+            log.info(f"Unchanged page: {name}")
+            return 'unchanged'
+        error = self.outbox.buried(book, chapter, name, digest)
+        if error is not None:
+            log.error(f"Not queueing page {name}, this render was given up on: {error}")
+            return 'errors'
+        self.outbox.put(book, chapter, name, content, digest)
+        log.info(f"Queued page: {name}")
+        return 'queued'
+    
+    def has_page(self, book: str, chapter: str, name: str) -> bool:
+        # Without an index (outbox mode during an outage), pending writes cover it
+        return self.index is None or self.index.get(book, chapter, name) is not None
+    
+    @property
+    def available(self) -> bool:
+        return self.index is not None
+    
+    def delete(self, book: str, chapter: str, name: str, log: BufferedLog) -> Optional[str]:
+        """Delete a page whose shard no longer exists, or queue its deletion"""
+        page_id = self.index.get(book, chapter, name)
+        if self.dry_run:
+            log.info(f"Would delete stale page: {name}")
+            return None
+        if self.outbox is not None:
+            if self.outbox.buried(book, chapter, name, None) is not None:
+                log.error(f"Not queueing deletion of stale page {name}, it was given up on")
+                return 'errors'
+            self.outbox.put_delete(book, chapter, name, page_id)
+            log.info(f"Queued deletion of stale page: {name}")
+            return 'queued'
+        self.api.delete_page(page_id)
+        self.index.remove(book, chapter, name)
+        self.hashes.discard(page_id)
+        log.info(f"Deleted stale page: {name}")
+        return 'deleted'
+    
+    def finish(self, stats: Dict[str, Any]):
+        """Flush the outbox, save page hashes and add the run's request stats"""
+        if self.outbox is not None:
+            if self.index is None:
+                stats['pending'] = len(self.outbox)
+            else:
+                self._flush(stats)
+        super().finish(stats)
+        self._add_request_stats(stats)
+    
+    def flush(self, stats: Dict[str, Any]):
+        """Push the outbox's pending writes, outside of a run"""
+        if not self.api:
+            raise RuntimeError("API not configured")
+        if self.outbox is None:
+            self.outbox = self.open_outbox()
+        limiter = self.api.limiter
+        self._started = (time.monotonic(), limiter.requests, limiter.throttled)
+        try:
+            if self.index is None:
+                self.index = RemoteIndex.load(self.api)
+        except Exception as e:
+            logger.warning(f"BookStack {self.name} unavailable, nothing flushed: {e}")
+            stats['pending'] = len(self.outbox)
+        else:
+            self._flush(stats)
+        super().finish(stats)
+        self._add_request_stats(stats)
+    
+    def _flush(self, stats: Dict[str, Any]):
+        """Drain the outbox in batches of `flush_batch`, oldest first
+        
+        Each batch is pushed on a pool of `concurrency` threads. An entry
+        leaves the outbox only once BookStack accepted it. If BookStack stops
+        responding (connection errors, 5xx, or 429s past the throttle
+        deadline) the flush stops after that batch, and the rest waits for
+        the next run.
+        """
+        if self.dry_run:
+            stats['pending'] = len(self.outbox)
+            logger.info(f"Would flush {stats['pending']} pending pages to {self.name}")
+            return
+        
+        executor = ThreadPoolExecutor(self.concurrency) if self.concurrency > 1 else InlineExecutor()
+        with executor as pool, profiled('flush'):
+            for batch in self.outbox.batches(self.flush_batch):
+                unavailable = False
+                for action, log, down in pool.map(self._flush_entry, batch):
+                    log.flush()
+                    unavailable = unavailable or down
+                    if action:
+                        stats[action] = stats.get(action, 0) + 1
+                if unavailable:
+                    logger.warning(f"BookStack {self.name} unavailable, stopping the flush")
+                    break
+        stats['pending'] = len(self.outbox)
+        if stats['pending']:
+            logger.info(f"{stats['pending']} pages left in the {self.name} outbox")
+    
+    def _flush_entry(self, entry: Dict[str, Any]) -> Tuple[Optional[str], BufferedLog, bool]:
+        """Push one outbox entry: (stats key, log, whether BookStack looked down)"""
+        log = BufferedLog()
+        book_name, chapter_name, page_name = entry['book'], entry['chapter'], entry['name']
+        try:
+            if entry['action'] == 'delete':
+                action = self._flush_delete(entry)
+            else:
+                digest = entry['digest']
+                existing_id = self.index.get(book_name, chapter_name, page_name)
+                if existing_id and self._is_unchanged(existing_id, digest):
+                    action = 'unchanged'
+                elif existing_id:
+                    self.api.update_page(existing_id, page_name, entry['markdown'])
+                    self.hashes.set(existing_id, digest)
+                    action = 'updated'
+                else:
+                    chapter_id = self._ensure_parents(book_name, chapter_name, log)
+                    page = self.api.create_page(chapter_id, page_name, entry['markdown'])
+                    self.index.add(page['id'], book_name, chapter_name, page_name)
+                    self.hashes.set(page['id'], digest)
+                    action = 'created'
+        except Exception as e:
+            if self._unavailable(e):
+                self.outbox.fail(entry, str(e), attempt=False)
+                log.info(f"Left page {page_name} in the outbox: {e}")
+                return None, log, True
+            attempts = entry['attempts'] + 1
+            if attempts >= self.max_attempts:
+                self.outbox.bury(entry, str(e))
+                log.error(f"Gave up on page {page_name} after {attempts} attempts: {e}")
+                return 'dead', log, False
+            self.outbox.fail(entry, str(e))
+            log.error(f"Error flushing page {page_name} (attempt {attempts}): {e}")
+            return 'errors', log, False
+        
+        self.outbox.done(entry)
+        log.info(f"{action.capitalize()} page: {page_name}")
+        return action, log, False
+    
+    def _flush_delete(self, entry: Dict[str, Any]) -> str:
+        """Delete a stale page; one that is already gone counts as deleted"""
+        try:
+            self.api.delete_page(entry['page_id'])
+        except Exception as e:
+            if getattr(getattr(e, 'response', None), 'status_code', None) != 404:
+                raise
+        self.index.remove(entry['book'], entry['chapter'], entry['name'])
+        self.hashes.discard(entry['page_id'])
+        return 'deleted'
+    
+    @staticmethod
+    def _unavailable(error: Exception) -> bool:
+        """Whether an API error means BookStack is down rather than the request is bad"""
+        import requests
+        
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        return status is not None and (status == 429 or status >= 500)
+    
+    def _add_request_stats(self, stats: Dict[str, Any]):
+        """Add the API requests, 429s and achieved request rate since the run started"""
+        since, requests_before, throttled_before = self._started
+        limiter = self.api.limiter
+        elapsed = time.monotonic() - since
+        stats['requests'] = limiter.requests - requests_before
+        stats['throttled'] = limiter.throttled - throttled_before
+        stats['requests_per_second'] = round(stats['requests'] / elapsed, 2) if elapsed > 0 else 0.0
+
+
+class FilesystemPublisher(PathPublisher):
+    """Writes pages as markdown files: <path>/<book>/<chapter>/<page>.md
+    
+    Path parts are slugified names. A page is rewritten when its content
+    changed or its file went missing, and files are replaced atomically so
+    a reader never sees half a page.
+    """
+    
+    def __init__(self, name: str, path: Path, state_path: Path, concurrency: int = 4):
+        super().__init__(name, state_path, concurrency)
+        self.root = path
+    
+    def _path(self, book: str, chapter: str, name: str) -> Path:
+        return self.root / slugify(book) / slugify(chapter) / f'{slugify(name)}.md'
+    
+    def _exists(self, book: str, chapter: str, name: str) -> bool:
+        return self._path(book, chapter, name).exists()
+    
+    def _write(self, book: str, chapter: str, name: str, content: str, digest: str,
+               replace: bool):
+        path = self._path(book, chapter, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{threading.get_ident()}')
+        tmp.write_text(content if content.endswith('\n') else content + '\n')
+        os.replace(tmp, path)
+    
+    def _remove(self, book: str, chapter: str, name: str):
+        self._path(book, chapter, name).unlink(missing_ok=True)
+
+
+class WebhookPublisher(PathPublisher):
+    """POSTs each changed page to a URL as JSON
+    
+    The body is {"event", "book", "chapter", "name", "markdown", "digest"}
+    with event one of created, updated or deleted (which has no markdown).
+    The endpoint can't be queried, so changes are detected against what it
+    last accepted. POSTs are retried on connection errors and 5xx: a page's
+    digest makes a replayed delivery easy to recognise.
+    """
+    
+    def __init__(self, name: str, url: str, state_path: Path, concurrency: int = 4,
+                 headers: Optional[Dict[str, str]] = None, timeout: Tuple[float, float] = (5, 30),
+                 retries: int = 3, backoff_factor: float = 0.5):
+        super().__init__(name, state_path, concurrency)
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+    
+    @cached_property
+    def session(self):
+        session = pooled_session(self.concurrency, self.retries, self.backoff_factor,
+                                 methods=frozenset(['POST']), statuses=(500, 502, 503, 504))
+        session.headers.update(self.headers)
+        return session
+    
+    def close(self):
+        if self.__dict__.get('session'):
+            self.session.close()
+    
+    def _post(self, event: str, book: str, chapter: str, name: str,
+              content: Optional[str] = None, digest: Optional[str] = None):
+        body = {'event': event, 'book': book, 'chapter': chapter, 'name': name,
+                'markdown': content, 'digest': digest}
+        resp = self.session.post(self.url, json=body, timeout=self.timeout)
+        resp.raise_for_status()
+    
+    def _write(self, book: str, chapter: str, name: str, content: str, digest: str,
+               replace: bool):
+        self._post('updated' if replace else 'created', book, chapter, name, content, digest)
+    
+    def _remove(self, book: str, chapter: str, name: str):
+        self._post('deleted', book, chapter, name)
+
+
+class LazyContext(Mapping):
+    """Template context whose values are computed on first access
+    
+    Each key maps to a zero-argument provider. A provider runs at most once
+    per run and may itself read other keys (vms_by_node reads vms).
+    """
+    
+    def __init__(self, providers: Dict[str, Callable[[], Any]]):
+        self._providers = providers
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+    
+    def __getitem__(self, key: str) -> Any:
+        if key in self._values:
+            return self._values[key]
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = self._providers[key]()
+            return self._values[key]
+    
+    def __contains__(self, key: object) -> bool:
+        # Mapping's default would compute the value just to test membership
+        return key in self._providers
+    
+    def invalidate(self, keys):
+        """Forget memoized values so they are recomputed on next access"""
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+    
+    def __iter__(self):
+        return iter(self._providers)
+    
+    def __len__(self) -> int:
+        return len(self._providers)
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """On-disk cache of parsed audit rows keyed by source file fingerprint
+    
+    Entries are keyed by parser method and path. A matching size and mtime is
+    a hit without reading the file; otherwise a matching content hash still
+    hits (touched but identical dumps). A re-parse overwrites the stale entry,
+    and entries for vanished files or an old row format are evicted on open.
+    """
+    
+    # Bump whenever the shape of the rows returned by AuditDataParser changes
+    VERSION = 4
+    
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS parsed ('
+            ' method TEXT NOT NULL, path TEXT NOT NULL, size INTEGER, mtime_ns INTEGER,'
+            ' sha256 TEXT, version INTEGER, rows BLOB, PRIMARY KEY (method, path))'
+        )
+        self.evict()
+    
+    def evict(self):
+        """Drop entries for missing files or an outdated row format"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM parsed WHERE version != ?', (self.VERSION,))
+            for (path,) in self._db.execute('SELECT DISTINCT path FROM parsed').fetchall():
+                if not os.path.exists(path):
+                    self._db.execute('DELETE FROM parsed WHERE path = ?', (path,))
+    
+    def get(self, method: str, filepath: Path, parse: Callable[[], Any]) -> Any:
+        """Return cached rows for a file, calling parse() on a miss"""
+        path = str(filepath)
+        stat = filepath.stat()
+        digest = None
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    'SELECT size, mtime_ns, sha256, rows FROM parsed WHERE method = ? AND path = ?',
+                    (method, path)
+                ).fetchone()
+            if row:
+                size, mtime_ns, sha256, blob = row
+                if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                    return pickle.loads(blob)
+                digest = file_sha256(filepath)
+                if digest == sha256:
+                    with self._lock, self._db:
+                        self._db.execute(
+                            'UPDATE parsed SET size = ?, mtime_ns = ? WHERE method = ? AND path = ?',
+                            (stat.st_size, stat.st_mtime_ns, method, path)
+                        )
+                    return pickle.loads(blob)
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            logger.warning(f"Parse cache lookup failed for {path}: {e}")
+        
+        rows = parse()
+        try:
+            digest = digest or file_sha256(filepath)
+            with self._lock, self._db:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (method, path, stat.st_size, stat.st_mtime_ns, digest, self.VERSION,
+                     pickle.dumps(rows, pickle.HIGHEST_PROTOCOL))
+                )
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Parse cache store failed for {path}: {e}")
+        return rows
+    
+    def close(self):
+        self._db.close()
+    
+    
+class PageInputStore(JsonStore):
+    """Input fingerprints of the pages last published everywhere, to skip unchanged ones"""
+    
+    NAME = 'page input store'
+    
+    # Bump whenever what goes into a fingerprint changes
+    VERSION = 1
+    
+    def __init__(self, path: Path):
+        self._files: Dict[str, List] = {}
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._staged: Dict[str, Dict[str, Any]] = {}
+        self._failed: Set[str] = set()
+        self._seen: Set[str] = set()
+        super().__init__(path)
+    
+    def _load(self, data: Dict[str, Any]):
+        if data.get('version') == self.VERSION:
+            self._files, self._pages = data['files'], data['pages']
+    
+    def _dump(self) -> Dict[str, Any]:
+        return {'version': self.VERSION, 'files': self._files, 'pages': self._pages}
+    
+    def file_digest(self, path: Path) -> str:
+        """SHA-256 of an audit file, re-read only when its size or mtime changed"""
+        stat = path.stat()
+        with self._lock:
+            cached = self._files.get(str(path))
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        digest = file_sha256(path)
+        with self._lock:
+            self._files[str(path)] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+    
+    def begin(self):
+        """Start a run: forget what the previous one staged"""
+        with self._lock:
+            self._staged, self._failed, self._seen = {}, set(), set()
+    
+    def unchanged(self, book: str, chapter: str, name: str, fingerprint: str) -> bool:
+        """Whether a page's inputs match those it was last published from"""
+        key = store_key(book, chapter, name)
+        with self._lock:
+            self._seen.add(key)
+            return self._pages.get(key, {}).get('fingerprint') == fingerprint
+    
+    def stage(self, book: str, chapter: str, name: str, record: Dict[str, Any]):
+        """Record a page's inputs, committed if the run publishes it everywhere"""
+        with self._lock:
+            self._staged[store_key(book, chapter, name)] = record
+    
+    def fail(self, book: str, chapter: str, name: str):
+        """Keep a page that failed to render or publish from being committed"""
+        with self._lock:
+            self._failed.add(store_key(book, chapter, name))
+    
+    def staged(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [record for key, record in self._staged.items() if key not in self._failed]
+    
+    def commit(self, prune: bool = False):
+        """Adopt the staged records of published pages
+        
+        With `prune` (a run over every configured page), pages the run did
+        not see, such as removed pages and stale shards, are dropped.
+        """
+        with self._lock:
+            for key, record in self._staged.items():
+                if key not in self._failed:
+                    self._pages[key] = record
+            if prune:
+                self._pages = {key: record for key, record in self._pages.items() if key in self._seen}
+                self._files = {path: stat for path, stat in self._files.items() if os.path.exists(path)}
+    
+    
+class MetricHistory:
+    """Node and VM numerics per audit snapshot, stored column-wise in chunks of CHUNK_SIZE"""
+    
+    FIELDS = ('cpu', 'mem', 'maxmem', 'disk', 'uptime')
+    CHUNK_SIZE = 128
+    
+    def __init__(self, path: Path, retention_days: float = 400):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.retention = retention_days * 86400
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS chunks ('
+            ' kind TEXT NOT NULL, entity TEXT NOT NULL, first_ts REAL NOT NULL,'
+            ' last_ts REAL NOT NULL, ts BLOB NOT NULL, '
+            + ', '.join(f'{field} BLOB NOT NULL' for field in self.FIELDS)
+            + ', PRIMARY KEY (kind, entity, first_ts))'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS chunks_last_ts ON chunks (kind, last_ts)')
+    
+    @staticmethod
+    def _unpack(blobs) -> List[array]:
+        columns = []
+        for blob in blobs:
+            column = array('d')
+            column.frombytes(blob)
+            columns.append(column)
+        return columns
+    
+    def record(self, kind: str, ts: float, samples: Dict[str, Tuple[float, ...]]) -> int:
+        """Append one sample per entity taken at `ts`; returns how many were new
+        
+        Chunks whose newest sample is older than the retention period are
+        dropped.
+        """
+        columns = ', '.join(self.FIELDS)
+        with self._lock:
+            # Each entity's newest chunk
+            last_chunks = {
+                entity: (first_ts, last_ts, self._unpack(blobs))
+                for entity, first_ts, last_ts, *blobs in self._db.execute(
+                    f'SELECT entity, first_ts, last_ts, ts, {columns} FROM chunks'
+                    ' JOIN (SELECT entity, MAX(first_ts) AS first_ts FROM chunks'
+                    '       WHERE kind = ? GROUP BY entity) USING (entity, first_ts)'
+                    ' WHERE kind = ?', (kind, kind)
+                )
+            }
+            rows = []
+            for entity, values in samples.items():
+                first_ts, last_ts, chunk = last_chunks.get(entity, (ts, None, None))
+                if last_ts is not None and last_ts >= ts:
+                    continue
+                if chunk is None or len(chunk[0]) >= self.CHUNK_SIZE:
+                    first_ts, chunk = ts, [array('d') for _ in range(len(self.FIELDS) + 1)]
+                chunk[0].append(ts)
+                for column, value in zip(chunk[1:], values):
+                    column.append(value if isinstance(value, (int, float)) else 0.0)
+                rows.append((kind, entity, first_ts, ts, *(column.tobytes() for column in chunk)))
+            
+            with self._db:
+                self._db.executemany(
+                    f'INSERT OR REPLACE INTO chunks VALUES ({", ".join("?" * (len(self.FIELDS) + 5))})',
+                    rows
+                )
+                self._db.execute('DELETE FROM chunks WHERE kind = ? AND last_ts < ?',
+                                 (kind, ts - self.retention))
+        return len(rows)
+    
+    def trends(self, kind: str, entities, windows: Tuple[int, ...] = (7, 30)) -> Dict[str, Dict]:
+        """Per entity and field: mean, p95 and growth over each window of days
+        
+        Returns {entity: {field: {'mean_7d', 'p95_7d', 'growth_7d', ...},
+        'samples_7d': n, ...}} for entities with history. Windows end at the
+        kind's latest snapshot. Stats are None for a window without samples;
+        growth, the least-squares slope in units per day, is also None with
+        a single sample. p95 interpolates linearly like numpy's default.
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        
+        with self._lock:
+            latest = self._db.execute('SELECT MAX(last_ts) FROM chunks WHERE kind = ?',
+                                      (kind,)).fetchone()[0]
+            if latest is None:
+                return {}
+            chunks = self._db.execute(
+                f'SELECT entity, ts, {", ".join(self.FIELDS)} FROM chunks'
+                ' WHERE kind = ? AND last_ts >= ? AND entity IN (SELECT value FROM json_each(?))'
+                ' ORDER BY entity, first_ts',
+                (kind, latest - max(windows) * 86400, json.dumps(list(entities)))
+            ).fetchall()
+        
+        # entity -> packed timestamps and fields, its chunks joined in order
+        parts: Dict[str, List[List[bytes]]] = {}
+        for entity, *blobs in chunks:
+            for column, blob in zip(parts.setdefault(entity, [[] for _ in blobs]), blobs):
+                column.append(blob)
+        series = {entity: [b''.join(column) for column in columns] for entity, columns in parts.items()}
+        
+        empty = (0, [None] * len(self.FIELDS), [None] * len(self.FIELDS), [None] * len(self.FIELDS))
+        if np:
+            # One (1 + fields, samples) matrix per entity, timestamps in row 0
+            matrices = {
+                entity: np.frombuffer(b''.join(columns), dtype=np.float64).reshape(len(columns), -1)
+                for entity, columns in series.items()
+            }
+        
+        trends = {entity: {field: {} for field in self.FIELDS} for entity in series}
+        for days in windows:
+            since = latest - days * 86400
+            if np:
+                stats = self._window_stats_numpy(np, matrices, since)
+            else:
+                stats = {}
+                for entity, blobs in series.items():
+                    times, *columns = (array('d', blob) for blob in blobs)
+                    stats[entity] = self._window_stats(times, columns, since)
+            for entity, trend in trends.items():
+                count, means, p95s, growths = stats.get(entity) or empty
+                trend[f'samples_{days}d'] = count
+                for field, mean, p95, growth in zip(self.FIELDS, means, p95s, growths):
+                    trend[field].update({f'mean_{days}d': mean, f'p95_{days}d': p95,
+                                         f'growth_{days}d': growth})
+        return trends
+    
+    @staticmethod
+    def _window_stats_numpy(np, matrices: Dict[str, Any], since: float) -> Dict[str, Tuple]:
+        """Window stats for every entity, one numpy call per statistic
+        
+        Entities with the same number of samples in the window (normally
+        all of them, as every snapshot records every entity) are stacked
+        into one (entities, fields, samples) array.
+        """
+        by_count: Dict[int, List[Tuple[str, Any]]] = {}
+        for entity, matrix in matrices.items():
+            count = matrix.shape[1] - int(np.searchsorted(matrix[0], since))
+            if count:
+                by_count.setdefault(count, []).append((entity, matrix[:, -count:]))
+        
+        stats = {}
+        for count, members in by_count.items():
+            stacked = np.stack([matrix for _, matrix in members])
+            times, values = stacked[:, 0], stacked[:, 1:]
+            means = values.mean(axis=2)
+            p95s = np.percentile(values, 95, axis=2)
+            growths = np.full(means.shape, None, dtype=object)
+            if count > 1:
+                days = (times - times.mean(axis=1, keepdims=True)) / 86400
+                slopes = np.einsum('efs,es->ef', values - means[:, :, None], days)
+                growths = slopes / (days * days).sum(axis=1)[:, None]
+            for i, (entity, _) in enumerate(members):
+                stats[entity] = (count, means[i].tolist(), p95s[i].tolist(), growths[i].tolist())
+        return stats
+    
+    @staticmethod
+    def _window_stats(times: array, columns: List[array], since: float):
+        start = bisect.bisect_left(times, since)
+        times = times[start:]
+        count = len(times)
+        if not count:
+            return None
+        t_mean = math.fsum(times) / count
+        days = [(t - t_mean) / 86400 for t in times]
+        spread = math.fsum(d * d for d in days)
+        means, p95s, growths = [], [], []
+        for column in columns:
+            values = column[start:]
+            mean = math.fsum(values) / count
+            ordered = sorted(values)
+            rank = (count - 1) * 0.95
+            low = int(rank)
+            high = min(low + 1, count - 1)
+            means.append(mean)
+            p95s.append(ordered[low] + (ordered[high] - ordered[low]) * (rank - low))
+            growths.append(
+                math.fsum(d * (v - mean) for d, v in zip(days, values)) / spread
+                if count > 1 and spread else None
+            )
+        return count, means, p95s, growths
+    
+    def close(self):
+        self._db.close()
+
+
+def format_bytes(bytes_val: Optional[float]) -> str:
+    """Format bytes to human readable, '-' when unknown"""
+    if bytes_val is None:
+        return '-'
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if bytes_val < 1024:
+            return f"{bytes_val:.1f}{unit}"
+        bytes_val /= 1024
+    return f"{bytes_val:.1f}PB"
+
+
+def format_growth(bytes_per_day: Optional[float]) -> str:
+    """Format a signed growth rate in bytes per day, '-' when unknown"""
+    if bytes_per_day is None:
+        return '-'
+    return ('+' if bytes_per_day >= 0 else '-') + format_bytes(abs(bytes_per_day)) + '/day'
+
+
+def format_percent(ratio: Optional[float], digits: int = 1) -> str:
+    """Format a 0-1 ratio as a percentage, '-' when unknown"""
+    if ratio is None:
+        return '-'
+    return f"{ratio * 100:.{digits}f}%"
+
+
+def format_uptime(seconds: int) -> str:
+    """Format uptime seconds to human readable"""
+    days = seconds // 86400
+    hours = (seconds % 86400) // 3600
+    return f"{days}d {hours}h"
+
+
+class Record:
+    """Parsed inventory row stored in __slots__ instead of a per-row dict
+    
+    Subclasses keep raw values (bytes, seconds, ratios) in slots and expose
+    the formatted values templates print as properties, computed on access.
+    Item access and get() are kept so rows still read like the old dicts.
+    """
+    
+    __slots__ = ()
+    
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """Raw fields as a plain dict"""
+        return {name: getattr(self, name) for name in self.__slots__}
+    
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and self.as_dict() == other.as_dict()
+    
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class ProxmoxNode(Record):
+    __slots__ = ('name', 'ip', 'status', 'cpu', 'cpu_cores', 'mem_used_bytes',
+                 'mem_total_bytes', 'disk_used_bytes', 'disk_total_bytes', 'uptime_seconds')
+    # Slots recorded as MetricHistory.FIELDS
+    HISTORY_FIELDS = ('cpu', 'mem_used_bytes', 'mem_total_bytes', 'disk_used_bytes', 'uptime_seconds')
+    
+    def __init__(self, name: str, ip: str, status: str, cpu: float, cpu_cores,
+                 mem_used_bytes: int, mem_total_bytes: int, disk_used_bytes: int,
+                 disk_total_bytes: int, uptime_seconds: int):
+        self.name = name
+        self.ip = ip
+        self.status = status
+        self.cpu = cpu
+        self.cpu_cores = cpu_cores
+        self.mem_used_bytes = mem_used_bytes
+        self.mem_total_bytes = mem_total_bytes
+        self.disk_used_bytes = disk_used_bytes
+        self.disk_total_bytes = disk_total_bytes
+        self.uptime_seconds = uptime_seconds
+    
+    @property
+    def cpu_usage(self) -> float:
+        return round(self.cpu * 100, 1)
+    
+    @property
+    def mem_used(self) -> str:
+        return format_bytes(self.mem_used_bytes)
+    
+    @property
+    def mem_total(self) -> str:
+        return format_bytes(self.mem_total_bytes)
+    
+    @property
+    def disk_used(self) -> str:
+        return format_bytes(self.disk_used_bytes)
+    
+    @property
+    def disk_total(self) -> str:
+        return format_bytes(self.disk_total_bytes)
+    
+    @property
+    def uptime(self) -> str:
+        return format_uptime(self.uptime_seconds)
+    
+    @property
+    def storage_pools(self) -> Tuple[str, ...]:
+        return ()
+
+
+class VM(Record):
+    __slots__ = ('name', 'vmid', 'status', 'ip', 'cpu', 'memory_bytes', 'node', 'purpose',
+                 'cpu_load', 'mem_used_bytes', 'disk_used_bytes', 'uptime_seconds')
+    HISTORY_FIELDS = ('cpu_load', 'mem_used_bytes', 'memory_bytes', 'disk_used_bytes', 'uptime_seconds')
+    
+    def __init__(self, name: str, vmid, status: str, ip: str, cpu: int,
+                 memory_bytes: int, node: str, purpose: str, cpu_load: float = 0.0,
+                 mem_used_bytes: int = 0, disk_used_bytes: int = 0, uptime_seconds: int = 0):
+        self.name = name
+        self.vmid = vmid
+        self.status = status
+        self.ip = ip
+        self.cpu = cpu
+        self.memory_bytes = memory_bytes
+        self.node = node
+        self.purpose = purpose
+        self.cpu_load = cpu_load
+        self.mem_used_bytes = mem_used_bytes
+        self.disk_used_bytes = disk_used_bytes
+        self.uptime_seconds = uptime_seconds
+    
+    @property
+    def memory(self) -> str:
+        return format_bytes(self.memory_bytes)
+
+
+class K3sNode(Record):
+    __slots__ = ('name', 'status', 'role', 'version', 'ip')
+    
+    def __init__(self, name: str, status: str, role: str, version: str, ip: str):
+        self.name = name
+        self.status = status
+        self.role = role
+        self.version = version
+        self.ip = ip
+
+
+class Namespace(Record):
+    __slots__ = ('name', 'status')
+    
+    def __init__(self, name: str, status: str):
+        self.name = name
+        self.status = status
+
+
+class Deployment(Record):
+    __slots__ = ('namespace', 'name', 'ready_replicas', 'replicas', 'image')
+    
+    def __init__(self, namespace: str, name: str, ready_replicas: int,
+                 replicas: Optional[int], image: str):
+        self.namespace = namespace
+        self.name = name
+        self.ready_replicas = ready_replicas
+        self.replicas = replicas
+        self.image = image
+    
+    @property
+    def ready(self) -> str:
+        if self.replicas is None:
+            return str(self.ready_replicas)
+        return f"{self.ready_replicas}/{self.replicas}"
+
+
+class Service(Record):
+    __slots__ = ('namespace', 'name', 'type', 'cluster_ip', 'external_ip', 'ports')
+    
+    def __init__(self, namespace: str, name: str, type: str, cluster_ip: str,
+                 external_ip: str, ports: str):
+        self.namespace = namespace
+        self.name = name
+        self.type = type
+        self.cluster_ip = cluster_ip
+        self.external_ip = external_ip
+        self.ports = ports
+
+
+class Ingress(Record):
+    __slots__ = ('namespace', 'name', 'host', 'address')
+    
+    def __init__(self, namespace: str, name: str, host: str, address: str):
+        self.namespace = namespace
+        self.name = name
+        self.host = host
+        self.address = address
+
+
+class InventoryIndex:
+    """Group-bys, counts and sums over one dataset, built in a single pass
+    
+    Templates read these precomputed views instead of filtering in Jinja:
+    `vm_index.groups.node`, `vm_index.count('status', 'running')`,
+    `vm_index.sum('memory_bytes', node='pve1')`. Non-numeric values (such
+    as 'N/A') are left out of sums.
+    """
+    
+    __slots__ = ('rows', 'groups', '_sums')
+    
+    def __init__(self, rows: List[Record], group_by: Tuple[str, ...] = (),
+                 sum_fields: Tuple[str, ...] = ()):
+        self.rows = rows
+        self.groups: Dict[str, Dict[Any, List[Record]]] = {key: {} for key in group_by}
+        totals = dict.fromkeys(sum_fields, 0)
+        self._sums: Dict[Optional[Tuple[str, Any]], Dict[str, float]] = {None: totals}
+        for row in rows:
+            numbers = [(field, getattr(row, field)) for field in sum_fields]
+            numbers = [(field, value) for field, value in numbers if isinstance(value, (int, float))]
+            for field, value in numbers:
+                totals[field] += value
+            for key in group_by:
+                value = getattr(row, key)
+                self.groups[key].setdefault(value, []).append(row)
+                group_sums = self._sums.setdefault((key, value), dict.fromkeys(sum_fields, 0))
+                for field, number in numbers:
+                    group_sums[field] += number
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+    
+    def count(self, key: str, value) -> int:
+        """Rows whose `key` equals `value`"""
+        return len(self.groups[key].get(value, ()))
+    
+    def counts(self, key: str) -> Dict[Any, int]:
+        """Row count per value of `key`"""
+        return {value: len(rows) for value, rows in self.groups[key].items()}
+    
+    def sum(self, field: str, **group) -> float:
+        """Total of `field`, overall or for one group, e.g. sum('cpu', node='pve1')"""
+        if not group:
+            return self._sums[None][field]
+        (key, value), = group.items()
+        return self._sums.get((key, value), {}).get(field, 0)
+
+
+def cached_parse(*filenames: str):
+    """Serve an AuditDataParser.get_* result from the parse cache, if enabled
+    
+    `filenames` are the method's candidate sources in order of preference;
+    the first one present is the file the cache entry is keyed on. Records
+    loaded in-process by an API collector are never cached. Either way, what
+    was read is noted in the parser's `opened`.
+    """
+    source = Path(filenames[0]).stem
+    
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self):
+            with metrics.phase('parse'), profiled('build_context'):
+                filepath = self.source_file(filenames)
+                if source in self.native:
+                    self.opened[method.__name__] = f'native:{source}'
+                elif filepath is not None:
+                    self.opened[method.__name__] = str(filepath)
+                if self.cache is None or filepath is None or source in self.native:
+                    return method(self)
+                return self.cache.get(method.__name__, filepath, lambda: method(self))
+        wrapper.sources = filenames
+        return wrapper
+    return decorator
+
+
 class AuditDataParser:
-    """Parse homelab audit results"""
+    """Parse homelab audit results
     
-    def __init__(self, results_dir: str):
+    K3s sources are read from `kubectl get -o json` dumps (<source>.json) or
+    JSON lines (<source>.jsonl, one object per line) when present, streamed
+    object by object, and fall back to the `kubectl get` text tables.
+    
+    Any source can instead be handed raw API objects with load_native(),
+    which then take precedence over its results file.
+    """
+    
+    def __init__(self, results_dir: str, cache: Optional[ParseCache] = None):
         self.results_dir = Path(results_dir).expanduser()
+        self.cache = cache
+        self.native: Dict[str, List[Dict]] = {}
+        self.native_times: Dict[str, float] = {}
+        # get_* method -> the results file (or native:<source>) it last read
+        self.opened: Dict[str, str] = {}
+    
+    def load_native(self, source: str, records: List[Dict]):
+        """Use records fetched in-process for `source` (e.g. 'k3s-nodes')"""
+        self.native[source] = records
+        self.native_times[source] = time.time()
+    
+    def source_file(self, filenames: Tuple[str, ...]) -> Optional[Path]:
+        """The first of a get_* method's candidate results files that exists"""
+        return next(
+            (self.results_dir / name for name in filenames if (self.results_dir / name).exists()),
+            None
+        )
+    
+    def input_fingerprint(self, method: str, file_digest: Callable[[Path], str]) -> str:
+        """What get_* `method` would read now: its native records, or its file and digest"""
+        filenames = getattr(type(self), method).sources
+        source = Path(filenames[0]).stem
+        if source in self.native:
+            records = json.dumps(self.native[source], sort_keys=True, default=str)
+            return f'native:{source}:{hashlib.sha256(records.encode()).hexdigest()}'
+        filepath = self.source_file(filenames)
+        if filepath is None:
+            return 'missing'
+        return f'{filepath}:{file_digest(filepath)}'
+    
+    def snapshot_time(self, source: str) -> float:
+        """When `source` was collected: its native fetch or its results file's mtime"""
+        if source in self.native_times:
+            return self.native_times[source]
+        try:
+            return (self.results_dir / f'{source}.json').stat().st_mtime
+        except OSError:
+            return time.time()
     
     def _read_json(self, filename: str) -> Optional[Dict]:
         """Read JSON file"""
@@ -130,61 +2194,105 @@ class AuditDataParser:
             return filepath.read_text()
         return None
     
-    def get_proxmox_nodes(self) -> List[Dict]:
+    def _read_proxmox(self, source: str) -> Optional[List[Dict]]:
+        """Proxmox resources for `source`, loaded natively or from <source>.json"""
+        if source in self.native:
+            return self.native[source]
+        return self._read_json(f'{source}.json')
+    
+    def _iter_k8s_objects(self, source: str) -> Optional[Iterator[Dict]]:
+        """Stream Kubernetes objects from <source>.json or <source>.jsonl
+        
+        Returns None when neither dump exists, so callers can fall back to
+        the text table.
+        """
+        if source in self.native:
+            return iter(self.native[source])
+        json_path = self.results_dir / f'{source}.json'
+        if json_path.exists():
+            return self._stream_list_items(json_path)
+        lines_path = self.results_dir / f'{source}.jsonl'
+        if lines_path.exists():
+            return self._stream_json_lines(lines_path)
+        return None
+    
+    @staticmethod
+    def _stream_list_items(path: Path) -> Iterator[Dict]:
+        """Yield the `items` of a kubectl List without loading the whole file"""
+        try:
+            import ijson
+        except ImportError:
+            # Without ijson the dump is loaded in one go
+            with open(path) as f:
+                yield from json.load(f).get('items', [])
+            return
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, 'items.item', use_float=True)
+    
+    @staticmethod
+    def _stream_json_lines(path: Path) -> Iterator[Dict]:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    
+    @cached_parse('proxmox-nodes.json')
+    def get_proxmox_nodes(self) -> List[ProxmoxNode]:
         """Get Proxmox node data"""
-        data = self._read_json('proxmox-nodes.json')
+        data = self._read_proxmox('proxmox-nodes')
         if not data:
             return []
         
-        nodes = []
-        for node in data:
-            nodes.append({
-                'name': node.get('node', 'unknown'),
-                'ip': node.get('ip', 'N/A'),
-                'status': node.get('status', 'unknown'),
-                'cpu_usage': round(node.get('cpu', 0) * 100, 1),
-                'mem_used': self._format_bytes(node.get('mem', 0)),
-                'mem_total': self._format_bytes(node.get('maxmem', 0)),
-                'disk_used': self._format_bytes(node.get('disk', 0)),
-                'disk_total': self._format_bytes(node.get('maxdisk', 0)),
-                'uptime': self._format_uptime(node.get('uptime', 0)),
-                'cpu_cores': node.get('maxcpu', 'N/A'),
-                'storage_pools': []
-            })
-        return nodes
+        return [
+            ProxmoxNode(
+                name=node.get('node', 'unknown'),
+                ip=node.get('ip', 'N/A'),
+                status=node.get('status', 'unknown'),
+                cpu=node.get('cpu', 0),
+                cpu_cores=node.get('maxcpu', 'N/A'),
+                mem_used_bytes=node.get('mem', 0),
+                mem_total_bytes=node.get('maxmem', 0),
+                disk_used_bytes=node.get('disk', 0),
+                disk_total_bytes=node.get('maxdisk', 0),
+                uptime_seconds=node.get('uptime', 0)
+            )
+            for node in data
+        ]
     
-    def get_vms(self) -> List[Dict]:
+    @cached_parse('proxmox-vms.json')
+    def get_vms(self) -> List[VM]:
         """Get VM inventory"""
-        data = self._read_json('proxmox-vms.json')
+        data = self._read_proxmox('proxmox-vms')
         if not data:
             return []
         
-        vms = []
-        for vm in data:
-            vms.append({
-                'name': vm.get('name', 'unknown'),
-                'vmid': vm.get('vmid', 'N/A'),
-                'status': vm.get('status', 'unknown'),
-                'ip': vm.get('ip', ''),
-                'cpu': vm.get('cpus', 1),
-                'memory': self._format_bytes(vm.get('maxmem', 0)),
-                'node': vm.get('node', 'unknown'),
-                'purpose': vm.get('description', '')
-            })
-        return sorted(vms, key=lambda x: x['name'])
-    
-    def get_vms_by_node(self, vms: List[Dict]) -> Dict[str, List[Dict]]:
-        """Group VMs by Proxmox node"""
-        by_node = {}
-        for vm in vms:
-            node = vm.get('node', 'unknown')
-            if node not in by_node:
-                by_node[node] = []
-            by_node[node].append(vm)
-        return by_node
-    
-    def get_k3s_nodes(self) -> List[Dict]:
+        vms = [
+            VM(
+                name=vm.get('name', 'unknown'),
+                vmid=vm.get('vmid', 'N/A'),
+                status=vm.get('status', 'unknown'),
+                ip=vm.get('ip', ''),
+                # /cluster/resources calls it maxcpu, and its cpu is the load
+                cpu=vm.get('cpus', vm.get('maxcpu', 1)),
+                memory_bytes=vm.get('maxmem', 0),
+                node=vm.get('node', 'unknown'),
+                purpose=vm.get('description', ''),
+                cpu_load=vm.get('cpu', 0.0),
+                mem_used_bytes=vm.get('mem', 0),
+                disk_used_bytes=vm.get('disk', 0),
+                uptime_seconds=vm.get('uptime', 0)
+            )
+            for vm in data
+        ]
+        return sorted(vms, key=lambda vm: vm.name)
+    
+    @cached_parse('k3s-nodes.json', 'k3s-nodes.jsonl', 'k3s-nodes.txt')
+    def get_k3s_nodes(self) -> List[K3sNode]:
         """Get K3s node data"""
+        objects = self._iter_k8s_objects('k3s-nodes')
+        if objects is not None:
+            return [self._k8s_node(obj) for obj in objects]
+        
         text = self._read_text('k3s-nodes.txt')
         if not text:
             return []
@@ -193,17 +2301,22 @@ class AuditDataParser:
         for line in text.strip().split('\n')[1:]:  # Skip header
             parts = line.split()
             if len(parts) >= 5:
-                nodes.append({
-                    'name': parts[0],
-                    'status': parts[1],
-                    'role': parts[2] if parts[2] != '<none>' else 'worker',
-                    'version': parts[4] if len(parts) > 4 else 'N/A',
-                    'ip': parts[5] if len(parts) > 5 else 'N/A'
-                })
+                nodes.append(K3sNode(
+                    name=parts[0],
+                    status=parts[1],
+                    role=parts[2] if parts[2] != '<none>' else 'worker',
+                    version=parts[4] if len(parts) > 4 else 'N/A',
+                    ip=parts[5] if len(parts) > 5 else 'N/A'
+                ))
         return nodes
     
-    def get_k3s_namespaces(self) -> List[Dict]:
+    @cached_parse('k3s-namespaces.json', 'k3s-namespaces.jsonl', 'k3s-namespaces.txt')
+    def get_k3s_namespaces(self) -> List[Namespace]:
         """Get K3s namespaces"""
+        objects = self._iter_k8s_objects('k3s-namespaces')
+        if objects is not None:
+            return [self._k8s_namespace(obj) for obj in objects]
+        
         text = self._read_text('k3s-namespaces.txt')
         if not text:
             return []
@@ -212,14 +2325,16 @@ class AuditDataParser:
         for line in text.strip().split('\n')[1:]:
             parts = line.split()
             if len(parts) >= 2:
-                namespaces.append({
-                    'name': parts[0],
-                    'status': parts[1]
-                })
+                namespaces.append(Namespace(name=parts[0], status=parts[1]))
         return namespaces
     
-    def get_k3s_deployments(self) -> List[Dict]:
+    @cached_parse('k3s-deployments.json', 'k3s-deployments.jsonl', 'k3s-deployments.txt')
+    def get_k3s_deployments(self) -> List[Deployment]:
         """Get K3s deployments"""
+        objects = self._iter_k8s_objects('k3s-deployments')
+        if objects is not None:
+            return [self._k8s_deployment(obj) for obj in objects]
+        
         text = self._read_text('k3s-deployments.txt')
         if not text:
             return []
@@ -228,16 +2343,24 @@ class AuditDataParser:
         for line in text.strip().split('\n')[1:]:
             parts = line.split()
             if len(parts) >= 4:
-                deployments.append({
-                    'namespace': parts[0],
-                    'name': parts[1],
-                    'ready': parts[2],
-                    'image': parts[3] if len(parts) > 3 else 'N/A'
-                })
+                # READY is "ready/total", or just the ready count from custom-columns
+                ready, _, total = parts[2].partition('/')
+                deployments.append(Deployment(
+                    namespace=parts[0],
+                    name=parts[1],
+                    ready_replicas=int(ready) if ready.isdigit() else 0,
+                    replicas=int(total) if total.isdigit() else None,
+                    image=parts[3] if len(parts) > 3 else 'N/A'
+                ))
         return deployments
     
-    def get_k3s_services(self) -> List[Dict]:
+    @cached_parse('k3s-services.json', 'k3s-services.jsonl', 'k3s-services.txt')
+    def get_k3s_services(self) -> List[Service]:
         """Get K3s services"""
+        objects = self._iter_k8s_objects('k3s-services')
+        if objects is not None:
+            return [self._k8s_service(obj) for obj in objects]
+        
         text = self._read_text('k3s-services.txt')
         if not text:
             return []
@@ -246,82 +2369,732 @@ class AuditDataParser:
         for line in text.strip().split('\n')[1:]:
             parts = line.split()
             if len(parts) >= 5:
-                services.append({
-                    'namespace': parts[0],
-                    'name': parts[1],
-                    'type': parts[2],
-                    'cluster_ip': parts[3],
-                    'external_ip': parts[4] if parts[4] != '<none>' else '',
-                    'ports': parts[5] if len(parts) > 5 else ''
-                })
+                services.append(Service(
+                    namespace=parts[0],
+                    name=parts[1],
+                    type=parts[2],
+                    cluster_ip=parts[3],
+                    external_ip=parts[4] if parts[4] != '<none>' else '',
+                    ports=parts[5] if len(parts) > 5 else ''
+                ))
         return services
     
-    def get_k3s_ingresses(self) -> List[Dict]:
+    @cached_parse('k3s-ingresses.json', 'k3s-ingresses.jsonl', 'k3s-ingresses.txt')
+    def get_k3s_ingresses(self) -> List[Ingress]:
         """Get K3s ingresses"""
+        objects = self._iter_k8s_objects('k3s-ingresses')
+        if objects is not None:
+            return [self._k8s_ingress(obj) for obj in objects]
+        
         text = self._read_text('k3s-ingresses.txt')
         if not text:
             return []
         
+        lines = text.strip().split('\n')
+        # Locate columns from the header: older kubectl has no CLASS column
+        header = lines[0].split()
+        host_col = header.index('HOSTS') if 'HOSTS' in header else 3
+        address_col = header.index('ADDRESS') if 'ADDRESS' in header else host_col + 1
+        
         ingresses = []
-        for line in text.strip().split('\n')[1:]:
+        for line in lines[1:]:
             parts = line.split()
-            if len(parts) >= 4:
-                ingresses.append({
-                    'namespace': parts[0],
-                    'name': parts[1],
-                    'host': parts[3] if len(parts) > 3 else 'N/A',
-                    'address': parts[4] if len(parts) > 4 else ''
-                })
+            if len(parts) > host_col:
+                ingresses.append(Ingress(
+                    namespace=parts[0],
+                    name=parts[1],
+                    host=parts[host_col],
+                    address=parts[address_col] if len(parts) > address_col else ''
+                ))
         return ingresses
     
+    # Normalizers from Kubernetes API objects to the rows produced by the
+    # text parsers above
+    
+    @staticmethod
+    def _lb_addresses(obj: Dict) -> List[str]:
+        ingress = obj.get('status', {}).get('loadBalancer', {}).get('ingress') or []
+        return [entry.get('ip') or entry.get('hostname', '') for entry in ingress]
+    
     @staticmethod
-    def _format_bytes(bytes_val: int) -> str:
-        """Format bytes to human readable"""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if bytes_val < 1024:
-                return f"{bytes_val:.1f}{unit}"
-            bytes_val /= 1024
-        return f"{bytes_val:.1f}PB"
+    def _k8s_node(obj: Dict) -> K3sNode:
+        meta, status = obj.get('metadata', {}), obj.get('status', {})
+        ready = any(
+            c.get('type') == 'Ready' and c.get('status') == 'True'
+            for c in status.get('conditions', [])
+        )
+        state = 'Ready' if ready else 'NotReady'
+        if obj.get('spec', {}).get('unschedulable'):
+            state += ',SchedulingDisabled'
+        roles = sorted(
+            label.split('/', 1)[1] for label in meta.get('labels', {})
+            if label.startswith('node-role.kubernetes.io/')
+        )
+        internal_ip = next(
+            (a.get('address') for a in status.get('addresses', []) if a.get('type') == 'InternalIP'),
+            'N/A'
+        )
+        return K3sNode(
+            name=meta.get('name', 'unknown'),
+            status=state,
+            role=','.join(roles) or 'worker',
+            version=status.get('nodeInfo', {}).get('kubeletVersion', 'N/A'),
+            ip=internal_ip
+        )
+    
+    @staticmethod
+    def _k8s_namespace(obj: Dict) -> Namespace:
+        return Namespace(
+            name=obj.get('metadata', {}).get('name', 'unknown'),
+            status=obj.get('status', {}).get('phase', 'unknown')
+        )
+    
+    @staticmethod
+    def _k8s_deployment(obj: Dict) -> Deployment:
+        meta, spec = obj.get('metadata', {}), obj.get('spec', {})
+        containers = spec.get('template', {}).get('spec', {}).get('containers', [])
+        return Deployment(
+            namespace=meta.get('namespace', 'default'),
+            name=meta.get('name', 'unknown'),
+            ready_replicas=obj.get('status', {}).get('readyReplicas') or 0,
+            replicas=spec.get('replicas', 0),
+            image=','.join(c.get('image', '') for c in containers) or 'N/A'
+        )
+    
+    @classmethod
+    def _k8s_service(cls, obj: Dict) -> Service:
+        meta, spec = obj.get('metadata', {}), obj.get('spec', {})
+        ports = []
+        for port in spec.get('ports', []):
+            node_port = f":{port['nodePort']}" if port.get('nodePort') else ''
+            ports.append(f"{port.get('port')}{node_port}/{port.get('protocol', 'TCP')}")
+        return Service(
+            namespace=meta.get('namespace', 'default'),
+            name=meta.get('name', 'unknown'),
+            type=spec.get('type', 'ClusterIP'),
+            cluster_ip=spec.get('clusterIP', ''),
+            external_ip=','.join(cls._lb_addresses(obj) + spec.get('externalIPs', [])),
+            ports=','.join(ports)
+        )
+    
+    @classmethod
+    def _k8s_ingress(cls, obj: Dict) -> Ingress:
+        meta = obj.get('metadata', {})
+        hosts = [rule['host'] for rule in obj.get('spec', {}).get('rules', []) if rule.get('host')]
+        return Ingress(
+            namespace=meta.get('namespace', 'default'),
+            name=meta.get('name', 'unknown'),
+            host=','.join(hosts) or '*',
+            address=','.join(cls._lb_addresses(obj))
+        )
+
+
+class AuditCollector:
+    """One audit source: a command whose stdout becomes a results file
+    
+    Output streams straight to `<output>.partial` and only replaces the
+    results file when the command succeeds, so a failed or timed out
+    collector leaves the previous good snapshot in place.
+    """
+    
+    def __init__(self, name: str, command, output: str, timeout: float = 120):
+        self.name = name
+        self.command = command
+        self.output = output
+        self.timeout = timeout
+    
+    @classmethod
+    def from_config(cls, config: Dict, default_timeout: float) -> 'AuditCollector':
+        return cls(
+            config['name'],
+            config['command'],
+            config['output'],
+            config.get('timeout', default_timeout)
+        )
+    
+    def run(self, results_dir: Path) -> Dict[str, Any]:
+        """Run the collector and report its exit code and duration"""
+        target = results_dir / self.output
+        partial = target.with_name(target.name + '.partial')
+        start = time.monotonic()
+        returncode, error = None, ''
+        try:
+            with open(partial, 'wb') as out:
+                # Own process group so a timeout also kills children (ssh, kubectl)
+                proc = subprocess.Popen(
+                    self.command,
+                    shell=isinstance(self.command, str),
+                    stdout=out,
+                    stderr=subprocess.PIPE,
+                    start_new_session=True
+                )
+                try:
+                    _, stderr = proc.communicate(timeout=self.timeout)
+                    returncode = proc.returncode
+                    error = stderr.decode(errors='replace').strip()
+                except subprocess.TimeoutExpired:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                    proc.communicate()
+                    error = f"timed out after {self.timeout}s"
+            
+            if returncode == 0:
+                os.replace(partial, target)
+        except Exception as e:
+            error = str(e)
+        finally:
+            # Left over when the command failed, or couldn't even be started
+            partial.unlink(missing_ok=True)
+        
+        return {
+            'name': self.name,
+            'output': str(target),
+            'returncode': returncode,
+            'duration': time.monotonic() - start,
+            'error': error
+        }
+
+
+class APICollector(ABC):
+    """Base for audit sources read in-process from an inventory API
+    
+    Subclasses map source names (the results file stems AuditDataParser
+    reads, e.g. 'k3s-nodes') to fetch functions. Each source is fetched as
+    its own task over the collector's pooled session, and the raw API
+    objects go straight to the parser: no subprocess, results file or
+    re-parse.
+    """
+    
+    name = 'api'
+    
+    def __init__(self, headers: Dict[str, str], verify=True, timeout: float = 120,
+                 pool_size: int = 5, retries: int = 3):
+        self.session = pooled_session(pool_size, retries, backoff_factor=0.5)
+        self.session.headers.update(headers)
+        self.session.verify = verify
+        self.timeout = (5, timeout)
+    
+    @abstractmethod
+    def sources(self) -> Dict[str, Callable[[], List[Dict]]]:
+        """Source name -> function fetching its raw API objects"""
+    
+    def _get(self, url: str, **params) -> Dict:
+        resp = self.session.get(url, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+    
+    def run(self, source: str) -> Dict[str, Any]:
+        """Fetch one source; reported like an AuditCollector result"""
+        start = time.monotonic()
+        records, returncode, error = None, None, ''
+        try:
+            records = self.sources()[source]()
+            returncode = 0
+        except Exception as e:
+            error = str(e)
+        return {
+            'name': f'{self.name}:{source}',
+            'output': source,
+            'returncode': returncode,
+            'duration': time.monotonic() - start,
+            'error': error,
+            'records': records
+        }
+    
+    def close(self):
+        self.session.close()
+
+
+class ProxmoxCollector(APICollector):
+    """Nodes and guests from the Proxmox VE `/cluster/resources` API"""
+    
+    name = 'proxmox'
+    
+    def __init__(self, url: str, token_id: str, token_secret: str, **kwargs):
+        super().__init__({'Authorization': f'PVEAPIToken={token_id}={token_secret}'}, **kwargs)
+        self.url = url.rstrip('/')
+    
+    @classmethod
+    def from_config(cls, config: Dict, default_timeout: float) -> 'ProxmoxCollector':
+        return cls(
+            config['url'],
+            config['token_id'],
+            config['token_secret'],
+            verify=config.get('verify_ssl', True),
+            timeout=config.get('timeout', default_timeout)
+        )
+    
+    def _resources(self, kind: str) -> List[Dict]:
+        return self._get(f'{self.url}/api2/json/cluster/resources', type=kind)['data']
+    
+    def sources(self) -> Dict[str, Callable[[], List[Dict]]]:
+        return {
+            'proxmox-nodes': lambda: self._resources('node'),
+            'proxmox-vms': lambda: self._resources('vm'),
+        }
+
+
+class KubernetesCollector(APICollector):
+    """Cluster objects from the Kubernetes API, listed in `limit` sized chunks"""
+    
+    name = 'kubernetes'
+    
+    # Source -> list path
+    RESOURCES = {
+        'k3s-nodes': '/api/v1/nodes',
+        'k3s-namespaces': '/api/v1/namespaces',
+        'k3s-deployments': '/apis/apps/v1/deployments',
+        'k3s-services': '/api/v1/services',
+        'k3s-ingresses': '/apis/networking.k8s.io/v1/ingresses',
+    }
+    
+    def __init__(self, server: str, token: str, chunk_size: int = 500, **kwargs):
+        super().__init__({'Authorization': f'Bearer {token}'}, **kwargs)
+        self.server = server.rstrip('/')
+        self.chunk_size = chunk_size
+    
+    @classmethod
+    def from_config(cls, config: Dict, default_timeout: float) -> 'KubernetesCollector':
+        token = config.get('token')
+        if not token and config.get('token_file'):
+            token = Path(config['token_file']).expanduser().read_text().strip()
+        verify = config.get('verify_ssl', True)
+        if verify and config.get('ca_cert'):
+            verify = str(Path(config['ca_cert']).expanduser())
+        return cls(
+            config['server'],
+            token or '',
+            chunk_size=config.get('chunk_size', 500),
+            verify=verify,
+            timeout=config.get('timeout', default_timeout)
+        )
+    
+    def list_objects(self, path: str) -> List[Dict]:
+        """All objects at `path`, following `continue` tokens
+        
+        A token that expires mid-listing (410 Gone) restarts the list once,
+        since the chunks would otherwise mix two resource versions.
+        """
+        import requests
+        
+        for attempt in range(2):
+            items, token = [], None
+            try:
+                while True:
+                    params = {'limit': self.chunk_size}
+                    if token:
+                        params['continue'] = token
+                    body = self._get(self.server + path, **params)
+                    items.extend(body.get('items') or [])
+                    token = body.get('metadata', {}).get('continue')
+                    if not token:
+                        return items
+            except requests.HTTPError as e:
+                if e.response.status_code != 410 or attempt:
+                    raise
+                logger.warning(f"List of {path} expired mid-way, restarting")
+    
+    def sources(self) -> Dict[str, Callable[[], List[Dict]]]:
+        return {
+            source: functools.partial(self.list_objects, path)
+            for source, path in self.RESOURCES.items()
+        }
+
+
+class AuditWatcher:
+    """Yields debounced batches of changed file names in the results dir
+    
+    Uses inotify through the optional inotify_simple package and falls back
+    to polling mtimes where it is unavailable.
+    """
+    
+    def __init__(self, directory: Path, debounce: float = 2.0, poll_interval: float = 5.0):
+        self.directory = directory
+        self.debounce = debounce
+        self.poll_interval = poll_interval
     
     @staticmethod
-    def _format_uptime(seconds: int) -> str:
-        """Format uptime seconds to human readable"""
-        days = seconds // 86400
-        hours = (seconds % 86400) // 3600
-        return f"{days}d {hours}h"
+    def _relevant(name: str) -> bool:
+        # Collectors stream into <file>.partial and rename on success
+        return bool(name) and not name.endswith('.partial')
+    
+    def batches(self) -> Iterator[Set[str]]:
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            logger.info(f"inotify_simple not installed, polling {self.directory} "
+                        f"every {self.poll_interval}s")
+            yield from self._poll()
+            return
+        
+        inotify = INotify()
+        inotify.add_watch(str(self.directory), flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE)
+        while True:
+            changed = {e.name for e in inotify.read() if self._relevant(e.name)}
+            # Keep absorbing events until the directory has been quiet for `debounce`
+            while True:
+                events = inotify.read(timeout=int(self.debounce * 1000))
+                if not events:
+                    break
+                changed.update(e.name for e in events if self._relevant(e.name))
+            if changed:
+                yield changed
+    
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and self._relevant(entry.name):
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+    
+    def _poll(self) -> Iterator[Set[str]]:
+        previous = self._snapshot()
+        while True:
+            time.sleep(self.poll_interval)
+            current = self._snapshot()
+            if current == previous:
+                continue
+            # Wait for writes to settle before reporting the batch
+            while True:
+                time.sleep(self.debounce)
+                settled = self._snapshot()
+                if settled == current:
+                    break
+                current = settled
+            changed = {name for name in previous.keys() | current.keys()
+                       if previous.get(name) != current.get(name)}
+            previous = current
+            yield changed
+
+
+# (updater, context) of the run whose render pool is forking; workers
+# inherit it and render against it
+_render_state: Optional[Tuple[Any, Mapping]] = None
+
+
+def _render_in_worker(template_name: str,
+                      values: Optional[Dict[str, Any]]) -> Tuple[str, float]:
+    """Render a page in a render pool worker: (markdown, seconds taken)"""
+    updater, context = _render_state
+    start = time.perf_counter()
+    content = updater.render_page(template_name, context, values)
+    return content, time.perf_counter() - start
+
+
+class RenderPool:
+    """Renders pages in forked worker processes
+    
+    Jinja rendering is CPU bound, so render threads share one core. The
+    context is warmed and the templates compiled before the fork, so the
+    workers inherit both copy-on-write and never parse audit files or touch
+    the caches. Per page only the job is pickled on the way out (a template
+    name, plus a shard's rows or other extra values) and the markdown on
+    the way back. Each submit() returns a Future that completes as soon as
+    its page is rendered, so pages reach the publish targets in completion
+    order.
+    """
+    
+    def __init__(self, updater, context: Mapping, workers: int):
+        global _render_state
+        import multiprocessing
+        
+        mp_context = multiprocessing.get_context('fork')  # ValueError where fork is unavailable
+        _render_state = (updater, context)
+        self._pool = ProcessPoolExecutor(workers, mp_context=mp_context)
+        # Fork every worker now, before the sync threads start
+        self._pool.submit(int).result()
+    
+    def submit(self, template_name: str, values: Optional[Dict[str, Any]] = None) -> Future:
+        return self._pool.submit(_render_in_worker, template_name, values)
+    
+    def close(self):
+        global _render_state
+        self._pool.shutdown()
+        _render_state = None
 
 
 class BookStackUpdater:
     """Main updater class"""
     
-    def __init__(self, config_path: str):
+    # Context keys backed by an audit source: key -> AuditDataParser method
+    CONTEXT_PARSERS = {
+        'nodes': 'get_proxmox_nodes',
+        'vms': 'get_vms',
+        'k3s_nodes': 'get_k3s_nodes',
+        'namespaces': 'get_k3s_namespaces',
+        'deployments': 'get_k3s_deployments',
+        'services': 'get_k3s_services',
+        'ingresses': 'get_k3s_ingresses',
+    }
+    
+    # Indexes built in one pass over a dataset:
+    # context key -> (dataset key, group-by fields, summed fields)
+    CONTEXT_INDEXES = {
+        'node_index': ('nodes', ('status',),
+                       ('cpu_cores', 'mem_used_bytes', 'mem_total_bytes',
+                        'disk_used_bytes', 'disk_total_bytes')),
+        'vm_index': ('vms', ('node', 'status'), ('cpu', 'memory_bytes')),
+        'k3s_node_index': ('k3s_nodes', ('status', 'role'), ()),
+        'namespace_index': ('namespaces', ('status',), ()),
+        'deployment_index': ('deployments', ('namespace',), ('ready_replicas', 'replicas')),
+        'service_index': ('services', ('namespace', 'type'), ()),
+        'ingress_index': ('ingresses', ('namespace',), ()),
+    }
+    
+    # shard_by -> dataset key -> field holding the shard value
+    SHARD_FIELDS = {
+        'namespace': {
+            'namespaces': 'name',
+            'deployments': 'namespace',
+            'services': 'namespace',
+            'ingresses': 'namespace',
+        },
+        'node': {
+            'nodes': 'name',
+            'vms': 'node',
+        },
+    }
+    
+    # MetricHistory kind -> (context key of its rows, audit source); each
+    # kind's aggregates are exposed as <kind>_trends
+    HISTORY_SOURCES = {
+        'node': ('nodes', 'proxmox-nodes'),
+        'vm': ('vms', 'proxmox-vms'),
+    }
+    
+    # Context keys computed from other keys
+    DERIVED_CONTEXT = {
+        'vms_by_node': ('vms',),
+        **{key: (spec[0],) for key, spec in CONTEXT_INDEXES.items()},
+        **{f'{kind}_trends': (spec[0],) for kind, spec in HISTORY_SOURCES.items()},
+    }
+    TREND_KEYS = {f'{kind}_trends' for kind in HISTORY_SOURCES}
+    
+    def __init__(self, config_path: str, use_cache: bool = True):
         self.config_path = Path(config_path).expanduser()
         self.config = self._load_config()
         self.dry_run = False
+        self.use_cache = use_cache
+        self.audit_results: List[Dict[str, Any]] = []
         
         # Initialize components
-        if self.config['bookstack']['api_token_id'] and self.config['bookstack']['api_token_secret']:
-            self.api = BookStackAPI(
-                self.config['bookstack']['url'],
-                self.config['bookstack']['api_token_id'],
-                self.config['bookstack']['api_token_secret']
-            )
-        else:
-            self.api = None
-            logger.warning("BookStack API credentials not configured")
+        self.cache_dir = Path(self.config.get('cache', {}).get('dir', DEFAULT_CACHE_DIR)).expanduser()
+        parse_cache = None
+        if use_cache:
+            try:
+                parse_cache = ParseCache(self.cache_dir / 'parse-cache.sqlite')
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Parse cache unavailable, parsing from scratch: {e}")
+        self.parser = AuditDataParser(self.config['audit']['results_dir'], cache=parse_cache)
+        
+        history_config = self.config.get('history', {})
+        self.trend_windows = tuple(history_config.get('windows', (7, 30)))
+        self.history: Optional[MetricHistory] = None
+        if history_config.get('enabled', True):
+            try:
+                self.history = MetricHistory(self.cache_dir / 'history.sqlite',
+                                             history_config.get('retention_days', 400))
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"History store unavailable, rendering without trends: {e}")
+        
+        self.concurrency = self.config.get('sync', {}).get('concurrency', 4)
+        self.render_workers = self.config.get('sync', {}).get('render_workers', 0)
+        self._renderer: Optional[RenderPool] = None
+        self._template_vars: Dict[str, Set[str]] = {}
+        self._template_refs: Dict[str, Set[str]] = {}
         
-        self.parser = AuditDataParser(self.config['audit']['results_dir'])
+        # Skip pages whose inputs are unchanged, unless `full`
+        self.full = False
+        self.inputs: Optional[PageInputStore] = None
+        if use_cache and self.config.get('sync', {}).get('incremental', True):
+            self.inputs = PageInputStore(self.cache_dir / 'page-inputs.json')
+        self._digests: Dict[str, str] = {}
+        self.shard_pages = ShardStore(self.cache_dir / 'shard-pages.json')
+    
+    @cached_property
+    def publishers(self) -> List[Publisher]:
+        """Targets listed under `publish`, by default just the `bookstack:` instance
+        
+        A bookstack entry's connection settings override the `bookstack:`
+        section's, so a standby instance only needs its url and token. Each
+        target keeps its own page hashes (and outbox) in the cache dir.
+        """
+        sync_config = self.config.get('sync', {})
+        targets: List[Publisher] = []
+        for entry in self.config.get('publish') or [{'type': 'bookstack'}]:
+            kind = entry.get('type', 'bookstack')
+            name = entry.get('name', kind)
+            if any(target.name == name for target in targets):
+                raise ValueError(f"Duplicate publish target name '{name}'")
+            # -j 1 (and --profile) keep every target on one thread as well
+            concurrency = 1 if self.concurrency == 1 else entry.get('concurrency', self.concurrency)
+            # The default instance keeps the state file names from before targets existed
+            suffix = '' if name == 'bookstack' else f'-{name}'
+            state_path = self.cache_dir / f'page-hashes{suffix}.json'
+            
+            if kind == 'bookstack':
+                targets.append(BookStackPublisher(
+                    name, {**self.config['bookstack'], **entry}, state_path,
+                    self.cache_dir / f'outbox{suffix}.sqlite',
+                    concurrency=concurrency,
+                    verify_remote=entry.get('verify_remote', sync_config.get('verify_remote', False)),
+                    use_outbox=entry.get('outbox', sync_config.get('outbox', False)),
+                    flush_batch=sync_config.get('flush_batch', 25),
+                    max_attempts=sync_config.get('outbox_max_attempts', 5)
+                ))
+            elif kind == 'filesystem':
+                path = Path(entry['path']).expanduser()
+                if not path.is_absolute():
+                    path = self.config_path.parent / path
+                targets.append(FilesystemPublisher(name, path, state_path, concurrency))
+            elif kind == 'webhook':
+                targets.append(WebhookPublisher(
+                    name, entry['url'], state_path, concurrency,
+                    headers=entry.get('headers'),
+                    timeout=(entry.get('connect_timeout', 5), entry.get('read_timeout', 30)),
+                    retries=entry.get('retries', 3),
+                    backoff_factor=entry.get('backoff_factor', 0.5)
+                ))
+            else:
+                raise ValueError(f"Unknown publish target type '{kind}' for {name}, "
+                                 f"expected bookstack, filesystem or webhook")
+        return targets
+    
+    @cached_property
+    def jinja_env(self):
+        """Jinja2 environment with an on-disk bytecode cache
         
-        # Setup Jinja2
-        template_dir = self.config_path.parent / 'templates'
-        self.jinja_env = Environment(loader=FileSystemLoader(str(template_dir)))
+        Jinja validates cached bytecode against a checksum of the template
+        source, so an edited template is recompiled automatically.
+        """
+        with timings.phase('jinja setup'):
+            from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+            
+            template_dir = self.config_path.parent / 'templates'
+            bytecode_cache = None
+            if self.use_cache:
+                bytecode_dir = self.cache_dir / 'jinja'
+                bytecode_dir.mkdir(parents=True, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(str(bytecode_dir))
+            env = Environment(
+                loader=FileSystemLoader(str(template_dir)),
+                bytecode_cache=bytecode_cache
+            )
+            env.filters['format_bytes'] = format_bytes
+            env.filters['format_growth'] = format_growth
+            env.filters['format_percent'] = format_percent
+            return env
+    
+    def close(self):
+        """Release the publish targets, parse cache and history, if they were opened"""
+        for target in self.__dict__.get('publishers', []):
+            target.close()
+        if self.parser.cache:
+            self.parser.cache.close()
+        if self.history:
+            self.history.close()
     
     def _load_config(self) -> Dict:
         """Load configuration file"""
-        with open(self.config_path) as f:
-            return yaml.safe_load(f)
+        with timings.phase('load config'):
+            import yaml
+            
+            with open(self.config_path) as f:
+                return yaml.safe_load(f)
     
     def run_audit(self) -> bool:
+        """Run the audit collectors concurrently, or the legacy audit script
+        
+        Returns True if at least one collector succeeded; sources whose
+        collector failed keep their previous results file.
+        """
+        with metrics.phase('audit'), profiled('run_audit'):
+            return self._run_collectors()
+    
+    def _api_collectors(self) -> Tuple[List[APICollector], List[Dict[str, Any]]]:
+        """In-process collectors configured under `audit.native`, and failed
+        results for those that could not be set up (e.g. a missing token_file)"""
+        audit_config = self.config['audit']
+        native = audit_config.get('native') or {}
+        default_timeout = audit_config.get('timeout', 120)
+        collectors, failures = [], []
+        for key, collector_class in (('proxmox', ProxmoxCollector), ('kubernetes', KubernetesCollector)):
+            if not native.get(key):
+                continue
+            try:
+                collectors.append(collector_class.from_config(native[key], default_timeout))
+            except Exception as e:
+                failures.append({
+                    'name': collector_class.name,
+                    'output': key,
+                    'returncode': None,
+                    'duration': 0.0,
+                    'error': f"cannot set up collector: {e}"
+                })
+        return collectors, failures
+    
+    def _run_collectors(self) -> bool:
+        audit_config = self.config['audit']
+        if not audit_config.get('collectors') and not audit_config.get('native'):
+            return self.run_audit_script()
+        
+        default_timeout = audit_config.get('timeout', 120)
+        collectors = [
+            AuditCollector.from_config(entry, default_timeout)
+            for entry in audit_config.get('collectors') or []
+        ]
+        api_collectors, failures = self._api_collectors()
+        results_dir = Path(audit_config['results_dir']).expanduser()
+        results_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Command collectors and every API source share one pool; both are
+        # I/O bound, so threads are enough to run them in parallel
+        tasks = [functools.partial(c.run, results_dir) for c in collectors]
+        tasks += [functools.partial(c.run, source) for c in api_collectors for source in c.sources()]
+        if not tasks and not failures:
+            logger.error("No audit collectors to run: audit.native has no known sources")
+            return False
+        logger.info(f"Running {len(tasks)} audit collectors")
+        workers = max(1, min(len(tasks), audit_config.get('workers', 8)))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                self.audit_results = failures + list(pool.map(lambda task: task(), tasks))
+        finally:
+            for collector in api_collectors:
+                collector.close()
+        
+        for result in self.audit_results:
+            records = result.pop('records', None)
+            if records is not None:
+                self.parser.load_native(result['output'], records)
+        
+        failed = 0
+        for result in self.audit_results:
+            if result['returncode'] == 0:
+                logger.info(f"Collector {result['name']}: ok in {result['duration']:.1f}s")
+            else:
+                failed += 1
+                status = 'failed' if result['returncode'] is None else f"exit {result['returncode']}"
+                logger.error(
+                    f"Collector {result['name']}: {status} in {result['duration']:.1f}s: "
+                    f"{result['error']}"
+                )
+        
+        if failed == len(self.audit_results):
+            return False
+        if failed:
+            logger.warning(f"Partial audit: {failed}/{len(self.audit_results)} collectors failed, "
+                           f"keeping their previous results")
+        else:
+            logger.info("Audit completed successfully")
+        return True
+    
+    @property
+    def audit_failed(self) -> bool:
+        """Whether any collector of the last audit failed"""
+        return any(result['returncode'] != 0 for result in self.audit_results)
+    
+    def run_audit_script(self) -> bool:
         """Run the homelab audit script"""
         script = Path(self.config['audit']['script']).expanduser()
         if not script.exists():
@@ -348,89 +3121,709 @@ class BookStackUpdater:
             logger.error(f"Error running audit: {e}")
             return False
     
-    def render_template(self, template_name: str, context: Dict) -> str:
-        """Render a Jinja2 template"""
+    def template_variables(self, template_name: str) -> Set[str]:
+        """Context keys a template (and anything it includes) refers to"""
+        if template_name not in self._template_vars:
+            from jinja2 import meta
+            
+            source = self.jinja_env.loader.get_source(self.jinja_env, template_name)[0]
+            ast = self.jinja_env.parse(source)
+            names = set(meta.find_undeclared_variables(ast))
+            refs = {ref for ref in meta.find_referenced_templates(ast) if ref and ref != template_name}
+            for ref in refs:
+                names |= self.template_variables(ref)
+            self._template_refs[template_name] = refs
+            self._template_vars[template_name] = names
+        return self._template_vars[template_name]
+    
+    def _template_digest(self, template_name: str) -> str:
+        """Digest of a template's source and those of the templates it includes"""
+        key = f'template:{template_name}'
+        if key not in self._digests:
+            source = self.jinja_env.loader.get_source(self.jinja_env, template_name)[0]
+            self.template_variables(template_name)
+            parts = [source] + [self._template_digest(ref)
+                                for ref in sorted(self._template_refs[template_name])]
+            self._digests[key] = hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+        return self._digests[key]
+    
+    def _key_digest(self, key: str, context: Mapping,
+                    values: Optional[Dict[str, Any]] = None) -> str:
+        """Digest of what a context key is built from ('' for keys like updated_at)"""
+        if values and key in values:
+            return hashlib.sha256(pickle.dumps(values[key], pickle.HIGHEST_PROTOCOL)).hexdigest()
+        if key in self.TREND_KEYS:
+            digest_key = f'value:{key}'
+            if digest_key not in self._digests:
+                self._digests[digest_key] = hashlib.sha256(
+                    pickle.dumps(context[key], pickle.HIGHEST_PROTOCOL)
+                ).hexdigest()
+            return self._digests[digest_key]
+        if key in self.DERIVED_CONTEXT:
+            return '+'.join(self._key_digest(name, context, values)
+                            for name in self.DERIVED_CONTEXT[key])
+        if key in self.CONTEXT_PARSERS:
+            digest_key = f'input:{key}'
+            if digest_key not in self._digests:
+                self._digests[digest_key] = self.parser.input_fingerprint(
+                    self.CONTEXT_PARSERS[key], self.inputs.file_digest
+                )
+            return self._digests[digest_key]
+        return ''
+    
+    def _changed_targets(self, targets: List[Tuple[Publisher, Executor]], book_name: str,
+                         chapter_name: str, page_config: Dict, context: Mapping,
+                         values: Optional[Dict[str, Any]] = None) -> List[Tuple[Publisher, Executor]]:
+        """The targets a page still has to be rendered for, none if its inputs are unchanged
+        
+        A page that went missing from a target counts as changed. A changed
+        page has its new fingerprint staged, to be committed once every
+        target has it. Targets with `verify_remote` always get the page, to
+        catch edits made in BookStack.
+        """
+        if self.inputs is None:
+            return targets
+        template_name = Path(page_config['template']).name
+        keys = sorted(self.template_variables(template_name))
+        fingerprint = hashlib.sha256(json.dumps({
+            'page': page_config,
+            'targets': [target.name for target in self.publishers],
+            'template': self._template_digest(template_name),
+            'inputs': {key: self._key_digest(key, context, values) for key in keys},
+        }, sort_keys=True, default=str).encode()).hexdigest()
+        page_name = page_config['name']
+        if (self.inputs.unchanged(book_name, chapter_name, page_name, fingerprint) and not self.full
+                and all(target.has_page(book_name, chapter_name, page_name) for target, _ in targets)):
+            return [(target, pool) for target, pool in targets if target.verify_remote]
+        self.inputs.stage(book_name, chapter_name, page_name, {'fingerprint': fingerprint, 'keys': keys})
+        return targets
+    
+    def _input_failed(self, book_name: str, chapter_name: str, page_name: str):
+        if self.inputs is not None:
+            self.inputs.fail(book_name, chapter_name, page_name)
+    
+    def _input_files(self, keys: List[str]) -> List[str]:
+        """Audit files (or native sources) read for the given context keys"""
+        files = set()
+        pending = list(keys)
+        while pending:
+            key = pending.pop()
+            if key in self.DERIVED_CONTEXT:
+                pending.extend(self.DERIVED_CONTEXT[key])
+            elif self.CONTEXT_PARSERS.get(key) in self.parser.opened:
+                files.add(self.parser.opened[self.CONTEXT_PARSERS[key]])
+        return sorted(files)
+    
+    def _save_inputs(self, prune: bool):
+        """Commit the fingerprints of the pages this run published"""
+        for record in self.inputs.staged():
+            record['files'] = self._input_files(record['keys'])
+        self.inputs.commit(prune)
+        try:
+            self.inputs.save()
+        except OSError as e:
+            logger.warning(f"Cannot save page inputs to {self.inputs.path}: {e}")
+    
+    def render_template(self, template_name: str, context: Mapping) -> str:
+        """Render a Jinja2 template, resolving only the context it uses"""
         template = self.jinja_env.get_template(template_name)
-        return template.render(**context)
+        names = self.template_variables(template_name)
+        values = {key: context[key] for key in names if key in context}
+        with metrics.phase('render'), profiled(f'render_template {template_name}'):
+            return template.render(values)
     
-    def build_context(self) -> Dict[str, Any]:
-        """Build template context from audit data"""
-        vms = self.parser.get_vms()
+    def render_page(self, template_name: str, context: Mapping,
+                    values: Optional[Dict[str, Any]] = None) -> str:
+        """Render a page template, with `values` layered over `context` if given"""
+        if values:
+            context = self.build_context(context, **values)
+        return self.render_template(template_name, context)
+    
+    def build_context(self, base: Optional[Mapping] = None, **values) -> LazyContext:
+        """Build template context from audit data
+        
+        Nothing is parsed here; each audit source is read the first time a
+        template refers to a key that needs it, and each *_index is built
+        the first time a template uses it.
+        
+        With `base`, inputs are read from that context instead and `values`
+        replace keys outright; derived keys are rebuilt on top, so a shard
+        context given a subset of rows gets indexes over just those rows.
+        Trends are the exception: they are keyed by name, so the base's
+        serve any subset, and a render worker never opens the history store.
+        """
+        if base is None:
+            providers = {
+                key: getattr(self.parser, method)
+                for key, method in self.CONTEXT_PARSERS.items()
+            }
+            providers.update({
+                'updated_at': lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'k3s_version': lambda: 'v1.33.3+k3s1',
+                'trend_windows': lambda: self.trend_windows,
+            })
+        else:
+            providers = {
+                key: functools.partial(base.__getitem__, key)
+                for key in base if key not in self.DERIVED_CONTEXT
+            }
+        
+        def index(dataset: str, group_by: Tuple[str, ...], sum_fields: Tuple[str, ...]):
+            return lambda: InventoryIndex(context[dataset], group_by, sum_fields)
+        
+        def trends(kind: str, dataset: str):
+            if base is not None:
+                return functools.partial(base.__getitem__, f'{kind}_trends')
+            return lambda: self.trends(kind, context[dataset])
+        
+        providers.update({key: index(*spec) for key, spec in self.CONTEXT_INDEXES.items()})
+        providers.update({
+            f'{kind}_trends': trends(kind, spec[0]) for kind, spec in self.HISTORY_SOURCES.items()
+        })
+        providers['vms_by_node'] = lambda: context['vm_index'].groups['node']
+        providers.update({key: (lambda value=value: value) for key, value in values.items()})
+        context = LazyContext(providers)
+        return context
+    
+    def record_history(self, context: Mapping, keys: Optional[Set[str]] = None):
+        """Append the current node and VM numerics to the history store
         
+        With `keys`, only kinds whose rows are among them or built into
+        them (trends, indexes) are recorded, so a run that doesn't render
+        them parses nothing for it.
+        """
+        if self.history is None:
+            return
+        if keys is not None:
+            keys = keys | {dep for name in keys for dep in self.DERIVED_CONTEXT.get(name, ())}
+        for kind, (key, source) in self.HISTORY_SOURCES.items():
+            if keys is not None and key not in keys:
+                continue
+            try:
+                rows = context[key]
+            except Exception as e:
+                # The pages built from these rows report the error themselves
+                logger.warning(f"Could not read {kind} rows to record history: {e}")
+                continue
+            if not rows:
+                continue
+            samples = {
+                row.name: tuple(getattr(row, field) for field in row.HISTORY_FIELDS)
+                for row in rows
+            }
+            try:
+                added = self.history.record(kind, self.parser.snapshot_time(source), samples)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not record {kind} history: {e}")
+                continue
+            logger.debug(f"Recorded {added} new {kind} samples")
+    
+    def trends(self, kind: str, rows: List[Record]) -> Dict[str, Dict]:
+        """History aggregates of `rows` keyed by name, {} without a history store"""
+        if self.history is None:
+            return {}
+        try:
+            return self.history.trends(kind, [row.name for row in rows], self.trend_windows)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read {kind} history: {e}")
+            return {}
+    
+    def context_keys_for_files(self, filenames: Set[str]) -> Set[str]:
+        """Context keys whose value depends on any of the given audit files"""
+        keys = {
+            key for key, method in self.CONTEXT_PARSERS.items()
+            if filenames & set(getattr(AuditDataParser, method).sources)
+        }
+        for key, inputs in self.DERIVED_CONTEXT.items():
+            if keys & set(inputs):
+                keys.add(key)
+        return keys
+    
+    @staticmethod
+    def _page_templates(page_config: Dict) -> Set[str]:
         return {
-            'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'nodes': self.parser.get_proxmox_nodes(),
-            'vms': vms,
-            'vms_by_node': self.parser.get_vms_by_node(vms),
-            'k3s_version': 'v1.33.3+k3s1',
-            'k3s_nodes': self.parser.get_k3s_nodes(),
-            'namespaces': self.parser.get_k3s_namespaces(),
-            'deployments': self.parser.get_k3s_deployments(),
-            'services': self.parser.get_k3s_services(),
-            'ingresses': self.parser.get_k3s_ingresses(),
+            Path(page_config[option]).name
+            for option in ('template', 'shard_template')
+            if page_config.get(option)
         }
     
-    def update_docs(self) -> Dict[str, int]:
-        """Update BookStack documentation"""
-        if not self.api:
-            logger.error("API not configured - cannot update docs")
-            return {'created': 0, 'updated': 0, 'errors': 1}
+    def _used_keys(self, names: Set[str]) -> Set[str]:
+        """Context keys the templates refer to, leaving out those that can't be read"""
+        used = set()
+        for name in names:
+            try:
+                used |= self.template_variables(name)
+            except Exception as e:
+                logger.debug(f"Cannot analyse template {name}: {e}")
+        return used
+    
+    def configured_templates(self) -> Set[str]:
+        """Template names used by pages in the config"""
+        return {
+            name
+            for book_config in self.config['books'].values()
+            for chapter_config in book_config.get('chapters', [])
+            for page_config in chapter_config.get('pages', [])
+            for name in self._page_templates(page_config)
+        }
+    
+    # Sync tasks run on a worker pool and return (stats key or None, log,
+    # child futures). Rendering runs on the updater's pool; a task's stats
+    # key is a (target, key) pair for work done on a target's pool. Workers
+    # only ever submit children, never wait on them, so the bounded pools
+    # cannot deadlock; the caller walks the tree in config order to keep
+    # logs and stats identical to a serial run.
+    
+    @staticmethod
+    def _executor(workers: int) -> Executor:
+        # A single worker runs inline, which also keeps --profile on one thread
+        return ThreadPoolExecutor(workers) if workers > 1 else InlineExecutor()
+    
+    def _log_prefix(self, target: Publisher) -> str:
+        return f"{target.name}: " if len(self.publishers) > 1 else ''
+    
+    def _sync_book(self, pool: Executor, targets: List[Tuple[Publisher, Executor]],
+                   book_config: Dict, context: Mapping,
+                   templates: Optional[Set[str]]) -> Tuple[Optional[str], BufferedLog, List[Future]]:
+        """Queue a book's chapters"""
+        chapters = [
+            pool.submit(self._sync_chapter, pool, targets, book_config['name'], chapter_config,
+                        context, templates)
+            for chapter_config in book_config.get('chapters', [])
+        ]
+        return None, BufferedLog(), chapters
+    
+    def _sync_chapter(self, pool: Executor, targets: List[Tuple[Publisher, Executor]],
+                      book_name: str, chapter_config: Dict, context: Mapping,
+                      templates: Optional[Set[str]]) -> Tuple[Optional[str], BufferedLog, List[Future]]:
+        """Queue a chapter's pages"""
+        chapter_name = chapter_config['name']
+        pages = []
+        for page_config in chapter_config.get('pages', []):
+            if not page_config.get('template'):
+                continue
+            if templates is not None and not self._page_templates(page_config) & templates:
+                continue
+            if page_config.get('shard_by'):
+                pages.append(pool.submit(self._sync_sharded_page, pool, targets, book_name,
+                                         chapter_name, page_config, context))
+            else:
+                pages.append(pool.submit(self._sync_page, pool, targets, book_name, chapter_name,
+                                         page_config, context))
+        return None, BufferedLog(), pages
+    
+    def _sync_page(self, pool: Executor, targets: List[Tuple[Publisher, Executor]],
+                   book_name: str, chapter_name: str, page_config: Dict, context: Mapping,
+                   values: Optional[Dict[str, Any]] = None) -> Tuple[Optional[str], BufferedLog, List[Future]]:
+        """Render a page once and hand it to every target
         
-        stats = {'created': 0, 'updated': 0, 'errors': 0}
-        context = self.build_context()
+        `values` are extra context keys, such as a shard's rows. With a
+        render pool the page is rendered in a worker process, and handed
+        back to `pool` for its targets as soon as the worker is done. A
+        page whose inputs are unchanged since it was last published is
+        skipped outright, but for targets that verify remote content.
+        """
+        log = BufferedLog()
+        page_name = page_config['name']
+        template_name = Path(page_config['template']).name
+        try:
+            targets = self._changed_targets(targets, book_name, chapter_name, page_config,
+                                            context, values)
+            if not targets:
+                log.info(f"Skipped page (inputs unchanged): {page_name}")
+                return 'skipped', log, []
+        except Exception as e:
+            log.error(f"Error with page {page_name}: {e}")
+            self._input_failed(book_name, chapter_name, page_name)
+            return 'errors', log, []
+        
+        if self._renderer is not None:
+            try:
+                rendered = self._renderer.submit(template_name, values)
+            except Exception as e:
+                # A worker died (e.g. OOM-killed) and broke the pool
+                log.warning(f"Rendering {page_name} in-process, render workers unavailable: {e}")
+            else:
+                page = Future()
+                rendered.add_done_callback(
+                    lambda rendered: self._hand_over(page, pool, targets, book_name, chapter_name,
+                                                     page_name, rendered)
+                )
+                return None, log, [page]
+        
+        try:
+            content = self.render_page(template_name, context, values)
+        except Exception as e:
+            log.error(f"Error with page {page_name}: {e}")
+            self._input_failed(book_name, chapter_name, page_name)
+            return 'errors', log, []
+        return None, log, self._publish_all(targets, book_name, chapter_name, page_name, content)
+    
+    def _hand_over(self, page: Future, pool: Executor, targets: List[Tuple[Publisher, Executor]],
+                   book_name: str, chapter_name: str, page_name: str, rendered: Future):
+        """Resolve `page` with a task on `pool` that publishes the rendered page
+        
+        Called on the render pool's own thread, which must neither publish
+        nor raise: an unresolved `page` would block the run forever.
+        """
+        try:
+            task = pool.submit(self._rendered, targets, book_name, chapter_name, page_name, rendered)
+        except Exception as e:
+            log = BufferedLog()
+            log.error(f"Error with page {page_name}: {e}")
+            self._input_failed(book_name, chapter_name, page_name)
+            page.set_result(('errors', log, []))
+        else:
+            page.set_result((None, BufferedLog(), [task]))
+    
+    def _rendered(self, targets: List[Tuple[Publisher, Executor]], book_name: str,
+                  chapter_name: str, page_name: str,
+                  rendered: Future) -> Tuple[Optional[str], BufferedLog, List[Future]]:
+        """Hand a page rendered by the render pool to every target"""
+        log = BufferedLog()
+        try:
+            content, seconds = rendered.result()
+            metrics.add_phase('render', seconds)
+            return None, log, self._publish_all(targets, book_name, chapter_name, page_name, content)
+        except Exception as e:
+            log.error(f"Error with page {page_name}: {e}")
+            self._input_failed(book_name, chapter_name, page_name)
+            return 'errors', log, []
+    
+    def _publish_all(self, targets: List[Tuple[Publisher, Executor]], book_name: str,
+                     chapter_name: str, page_name: str, content: str) -> List[Future]:
+        digest = content_hash(content)
+        return [
+            target_pool.submit(self._publish, target, book_name, chapter_name, page_name,
+                               content, digest)
+            for target, target_pool in targets
+        ]
+    
+    def _publish(self, target: Publisher, book_name: str, chapter_name: str, page_name: str,
+                 content: str, digest: str) -> Tuple[Optional[Tuple[str, str]], BufferedLog, List[Future]]:
+        """Publish a rendered page to one target"""
+        log = BufferedLog(self._log_prefix(target))
+        try:
+            action = target.publish(book_name, chapter_name, page_name, content, digest, log)
+        except Exception as e:
+            log.error(f"Error with page {page_name}: {e}")
+            action = 'errors'
+        if action == 'errors':
+            self._input_failed(book_name, chapter_name, page_name)
+        return (target.name, action) if action else None, log, []
+    
+    def shard_rows(self, context: Mapping, shard_by: str) -> Dict[str, Dict[str, List[Record]]]:
+        """Rows of each sharded dataset grouped by shard value, one pass per dataset"""
+        return {
+            key: InventoryIndex(context[key], (field,)).groups[field]
+            for key, field in self.SHARD_FIELDS[shard_by].items()
+        }
+    
+    @staticmethod
+    def _shard_title(page_config: Dict, shard: str) -> str:
+        return page_config.get('shard_title', '{page}: {shard}').format(
+            page=page_config['name'], shard=shard
+        )
+    
+    def _sync_sharded_page(self, pool: Executor, targets: List[Tuple[Publisher, Executor]],
+                           book_name: str, chapter_name: str, page_config: Dict,
+                           context: Mapping) -> Tuple[Optional[str], BufferedLog, List[Future]]:
+        """Queue one page per shard and the index page, and delete stale shards
+        
+        Shard pages render `shard_template` with a context holding only the
+        shard's rows (plus `shard`, its value). The index page renders
+        `template` with the full context plus `shards`, the shard values and
+        page titles. Each page goes through the usual change detection, so
+        only shards whose content changed are pushed. Only shard pages this
+        updater published are ever deleted, never hand-written lookalikes.
+        """
+        log = BufferedLog()
+        page_name = page_config['name']
+        shard_by = page_config['shard_by']
+        try:
+            if shard_by not in self.SHARD_FIELDS:
+                raise ValueError(f"unknown shard_by '{shard_by}', expected one of "
+                                 f"{', '.join(self.SHARD_FIELDS)}")
+            # Otherwise a shard could take the name of any page in the chapter
+            if not self._shard_title(page_config, '').strip():
+                raise ValueError("shard_title needs text besides {shard}")
+            rows = self.shard_rows(context, shard_by)
+            # Values seen in any dataset, the defining one (namespaces, nodes) first
+            shards = list(dict.fromkeys(value for groups in rows.values() for value in groups))
+            titles = {shard: self._shard_title(page_config, shard) for shard in shards}
+        except Exception as e:
+            log.error(f"Error sharding page {page_name}: {e}")
+            return 'errors', log, []
+        
+        log.info(f"Sharding page {page_name} by {shard_by}: {len(shards)} shards")
+        children = []
+        shard_template = page_config.get('shard_template', page_config['template'])
+        for shard in shards:
+            shard_values = {key: groups.get(shard, []) for key, groups in rows.items()}
+            shard_values['shard'] = shard
+            shard_page = {'name': titles[shard], 'template': shard_template}
+            children.append(pool.submit(self._sync_page, pool, targets, book_name, chapter_name,
+                                        shard_page, context, shard_values))
+        
+        index_values = {'shards': [{'name': shard, 'title': titles[shard]} for shard in shards]}
+        children.append(pool.submit(self._sync_page, pool, targets, book_name, chapter_name,
+                                    page_config, context, index_values))
+        
+        # Shard pages published by earlier runs whose shard no longer exists
+        current = {title.lower() for title in titles.values()}
+        for target, target_pool in targets:
+            owned = self.shard_pages.get(target.name, book_name, chapter_name, page_name)
+            stale = [name for name in owned if name.lower() not in current]
+            # Stale shards stay recorded until they are deleted
+            self.shard_pages.set(target.name, book_name, chapter_name, page_name,
+                                 list(titles.values()) + stale)
+            if not target.available:
+                log.info(f"{target.name} unavailable, not checking {page_name} for stale shards")
+                continue
+            for name in stale:
+                if target.has_page(book_name, chapter_name, name):
+                    children.append(target_pool.submit(self._delete_page, target, book_name,
+                                                       chapter_name, name, page_name))
+                else:
+                    self.shard_pages.discard(target.name, book_name, chapter_name, page_name, name)
+        return None, log, children
+    
+    def _delete_page(self, target: Publisher, book_name: str, chapter_name: str, page_name: str,
+                     sharded_page: str) -> Tuple[Optional[Tuple[str, str]], BufferedLog, List[Future]]:
+        """Delete a page whose shard no longer exists from one target"""
+        log = BufferedLog(self._log_prefix(target))
+        try:
+            action = target.delete(book_name, chapter_name, page_name, log)
+        except Exception as e:
+            log.error(f"Error deleting page {page_name}: {e}")
+            action = 'errors'
+        if action in ('deleted', 'queued'):
+            self.shard_pages.discard(target.name, book_name, chapter_name, sharded_page, page_name)
+        return (target.name, action) if action else None, log, []
+    
+    def _collect(self, future: Future, stats: Dict[str, Any]):
+        """Wait for a sync task and its children, emitting logs in order"""
+        action, log, children = future.result()
+        log.flush()
+        if isinstance(action, tuple):
+            target, action = action
+            stats['targets'][target][action] += 1
+        elif action:
+            stats[action] += 1
+        for child in children:
+            self._collect(child, stats)
+    
+    @staticmethod
+    def _start_target(target: Publisher) -> Optional[Exception]:
+        try:
+            target.start()
+        except Exception as e:
+            return e
+        return None
+    
+    @staticmethod
+    def _new_stats() -> Dict[str, Any]:
+        return {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'deleted': 0, 'errors': 0,
+                'targets': {}}
+    
+    @staticmethod
+    def _add_target_stats(stats: Dict[str, Any]):
+        """Add each target's counts to the run totals
         
-        for book_key, book_config in self.config['books'].items():
+        Targets run concurrently, so their request rates add up as well.
+        """
+        for target_stats in stats['targets'].values():
+            for key, value in target_stats.items():
+                stats[key] = stats.get(key, 0) + value
+        if 'requests_per_second' in stats:
+            stats['requests_per_second'] = round(stats['requests_per_second'], 2)
+    
+    def _start_render_pool(self, context: Mapping,
+                           templates: Optional[Set[str]]) -> Optional[RenderPool]:
+        """Warm the context for the pages to render and fork `render_workers` workers
+        
+        Returns None, to render in threads, where processes can't be forked.
+        """
+        names = self.configured_templates() if templates is None else templates
+        # Anything failing here fails again, and is reported, on the pages using it
+        for name in names:
+            try:
+                self.jinja_env.get_template(name)
+            except Exception as e:
+                logger.debug(f"Not warming template {name}: {e}")
+        for key in self._used_keys(names) & set(context):
             try:
-                # Find or create book
-                book = self.api.find_or_create_book(book_config['name'])
-                book_id = book['id']
-                
-                for chapter_config in book_config.get('chapters', []):
-                    # Find or create chapter
-                    chapter = self.api.find_or_create_chapter(book_id, chapter_config['name'])
-                    chapter_id = chapter['id']
-                    
-                    for page_config in chapter_config.get('pages', []):
-                        template_file = page_config.get('template')
-                        if not template_file:
-                            continue
-                        
-                        try:
-                            # Render template
-                            content = self.render_template(
-                                Path(template_file).name,
-                                context
-                            )
-                            
-                            # Find existing page or create new
-                            pages = self.api.get_pages(chapter_id)
-                            existing = next(
-                                (p for p in pages if p['name'].lower() == page_config['name'].lower()),
-                                None
-                            )
-                            
-                            if self.dry_run:
-                                action = "Would update" if existing else "Would create"
-                                logger.info(f"{action} page: {page_config['name']}")
-                            elif existing:
-                                self.api.update_page(existing['id'], page_config['name'], content)
-                                logger.info(f"Updated page: {page_config['name']}")
-                                stats['updated'] += 1
-                            else:
-                                self.api.create_page(chapter_id, page_config['name'], content)
-                                logger.info(f"Created page: {page_config['name']}")
-                                stats['created'] += 1
-                                
-                        except Exception as e:
-                            logger.error(f"Error with page {page_config['name']}: {e}")
-                            stats['errors'] += 1
-                            
+                context[key]
             except Exception as e:
-                logger.error(f"Error with book {book_config['name']}: {e}")
-                stats['errors'] += 1
+                logger.debug(f"Not warming context key {key}: {e}")
+        try:
+            return RenderPool(self, context, self.render_workers)
+        except (ValueError, OSError) as e:
+            logger.warning(f"Rendering in threads, cannot start render workers: {e}")
+            return None
+    
+    def _stop_render_pool(self):
+        self._renderer.close()
+        self._renderer = None
+    
+    def update_docs(self, context: Optional[LazyContext] = None,
+                    templates: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """Render the configured pages and publish them to every target
+        
+        `templates` restricts the run to pages rendered from those templates.
         
+        Each page is rendered once and handed to all targets, each on its
+        own pool, so a mirror adds neither renders nor (unless it is the
+        slowest) wall time. With `render_workers`, pages are rendered in
+        that many forked processes instead of on the sync threads. The
+        stats sum every target, with each target's own counts under
+        'targets'. A target that cannot start, such as an unreachable
+        BookStack without an outbox, counts one error and sits the run out
+        while the others still get every page.
+        
+        Pages whose inputs are unchanged since they were last published
+        everywhere are skipped before rendering (see PageInputStore), unless
+        `full` is set.
+        """
+        stats = self._new_stats()
+        self._digests = {}
+        if self.inputs is not None:
+            self.inputs.begin()
+        if context is None:
+            context = self.build_context()
+        if not self.dry_run:
+            names = self.configured_templates() if templates is None else templates
+            self.record_history(context, self._used_keys(names))
+        
+        with metrics.phase('sync'):
+            # Targets index themselves (and flush, below) side by side too
+            for target in self.publishers:
+                target.dry_run = self.dry_run
+                stats['targets'][target.name] = target.new_stats()
+            with self._executor(len(self.publishers)) as pool:
+                started = list(pool.map(self._start_target, self.publishers))
+            ready = []
+            for target, error in zip(self.publishers, started):
+                if error:
+                    logger.error(f"Publish target {target.name} unavailable: {error}")
+                    stats['targets'][target.name]['errors'] += 1
+                else:
+                    ready.append(target)
+            
+            if ready:
+                with ExitStack() as stack, profiled('update_docs'):
+                    if self.render_workers > 0:
+                        self._renderer = self._start_render_pool(context, templates)
+                        if self._renderer is not None:
+                            stack.callback(self._stop_render_pool)
+                    # Rendered pages are handed back to this pool, so it needs a thread
+                    # of its own even at concurrency 1
+                    pool = stack.enter_context(
+                        ThreadPoolExecutor(self.concurrency) if self._renderer is not None
+                        else self._executor(self.concurrency)
+                    )
+                    targets = [
+                        (target, stack.enter_context(self._executor(target.concurrency)))
+                        for target in ready
+                    ]
+                    books = [
+                        pool.submit(self._sync_book, pool, targets, book_config, context, templates)
+                        for book_config in self.config['books'].values()
+                    ]
+                    for book in books:
+                        self._collect(book, stats)
+            
+            with self._executor(len(ready)) as pool:
+                list(pool.map(lambda target: target.finish(stats['targets'][target.name]), ready))
+            
+            if not self.dry_run:
+                try:
+                    self.shard_pages.save()
+                except OSError as e:
+                    logger.warning(f"Cannot save shard pages to {self.shard_pages.path}: {e}")
+            
+            # Only a run every target took part in may vouch for a page
+            if self.inputs is not None and not self.dry_run and len(ready) == len(self.publishers):
+                self._save_inputs(prune=templates is None)
+        
+        self._add_target_stats(stats)
+        metrics.record_run(stats)
+        return stats
+    
+    def flush_outbox(self) -> Dict[str, Any]:
+        """Push the pending writes of every BookStack target's outbox, without rendering"""
+        stats = self._new_stats()
+        with metrics.phase('sync'):
+            for target in self.publishers:
+                if not isinstance(target, BookStackPublisher):
+                    continue
+                target.dry_run = self.dry_run
+                target_stats = stats['targets'][target.name] = target.new_stats()
+                try:
+                    target.flush(target_stats)
+                except Exception as e:
+                    logger.error(f"Cannot flush the {target.name} outbox: {e}")
+                    target_stats['errors'] += 1
+        
+        self._add_target_stats(stats)
+        metrics.record_run(stats)
         return stats
     
+    def export_metrics(self):
+        """Write the node_exporter textfile, if configured"""
+        textfile = self.config.get('metrics', {}).get('textfile')
+        if not textfile:
+            return
+        try:
+            metrics.write_textfile(textfile)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {textfile}: {e}")
+    
+    def watch(self):
+        """Re-sync pages whenever the audit files they depend on change
+        
+        The HTTP pool, compiled templates, remote index and already parsed
+        context stay warm between events; only context keys fed by changed
+        files are recomputed and only pages using them are re-rendered.
+        """
+        watch_config = self.config.get('watch', {})
+        results_dir = self.parser.results_dir
+        results_dir.mkdir(parents=True, exist_ok=True)
+        watcher = AuditWatcher(
+            results_dir,
+            debounce=watch_config.get('debounce', 2.0),
+            poll_interval=watch_config.get('poll_interval', 5.0)
+        )
+        
+        listen = self.config.get('metrics', {}).get('listen')
+        if listen:
+            metrics.serve(int(listen))
+        
+        context = self.build_context()
+        logger.info(f"Initial sync complete: {self.update_docs(context)}")
+        self.export_metrics()
+        logger.info(f"Watching {results_dir} for audit changes")
+        
+        for changed in watcher.batches():
+            keys = self.context_keys_for_files(changed)
+            templates = {
+                name for name in self.configured_templates()
+                if self.template_variables(name) & keys
+            }
+            if not templates:
+                logger.debug(f"No pages depend on {sorted(changed)}")
+                continue
+            
+            logger.info(f"Changed: {', '.join(sorted(changed))} -> "
+                        f"re-syncing {', '.join(sorted(templates))}")
+            context.invalidate(keys | {'updated_at'})
+            try:
+                stats = self.update_docs(context, templates=templates)
+                logger.info(f"Sync complete: {stats}")
+            except Exception as e:
+                logger.error(f"Sync failed: {e}")
+            self.export_metrics()
+    
     def send_notification(self, stats: Dict[str, int]):
         """Send Discord notification"""
         if not self.config['discord'].get('enabled'):
@@ -447,11 +3840,28 @@ class BookStackUpdater:
         embed = DiscordEmbed(
             title="📚 BookStack Docs Updated",
             description=f"Homelab documentation has been updated.",
-            color=0x00ff00 if stats['errors'] == 0 else 0xff9900
+            color=0x00ff00 if stats['errors'] == 0 and not stats.get('pending') else 0xff9900
         )
         embed.add_embed_field(name="Pages Created", value=str(stats['created']))
         embed.add_embed_field(name="Pages Updated", value=str(stats['updated']))
+        embed.add_embed_field(name="Pages Unchanged", value=str(stats['unchanged']))
+        if stats.get('skipped'):
+            embed.add_embed_field(name="Pages Skipped", value=str(stats['skipped']))
+        embed.add_embed_field(name="Pages Deleted", value=str(stats['deleted']))
         embed.add_embed_field(name="Errors", value=str(stats['errors']))
+        if stats.get('pending'):
+            embed.add_embed_field(name="Pages Pending", value=str(stats['pending']))
+        if stats.get('dead'):
+            embed.add_embed_field(name="Pages Given Up", value=str(stats['dead']))
+        if len(stats.get('targets', {})) > 1:
+            embed.add_embed_field(
+                name="Targets",
+                value='\n'.join(
+                    f"{name}: {s['created']} created, {s['updated']} updated, {s['errors']} errors"
+                    for name, s in stats['targets'].items()
+                ),
+                inline=False
+            )
         embed.add_embed_field(
             name="Link",
             value=f"[View Docs]({self.config['bookstack']['url']})",
@@ -465,13 +3875,33 @@ class BookStackUpdater:
 
 
 def main():
+    global profiler
+    
     parser = argparse.ArgumentParser(description='BookStack Documentation Auto-Updater')
     parser.add_argument('--config', '-c', default='config.yaml', help='Config file path')
     parser.add_argument('--audit', '-a', action='store_true', help='Run audit before update')
     parser.add_argument('--update', '-u', action='store_true', help='Update BookStack docs')
     parser.add_argument('--dry-run', '-n', action='store_true', help='Dry run (no changes)')
+    parser.add_argument('--full', action='store_true',
+                        help='Render every page, even those whose inputs are unchanged')
+    parser.add_argument('--flush', action='store_true',
+                        help='Push pages pending in the outbox, without rendering')
+    parser.add_argument('--watch', '-w', action='store_true',
+                        help='Keep running and sync pages when their audit files change')
     parser.add_argument('--notify', action='store_true', help='Send Discord notification')
+    parser.add_argument('--concurrency', '-j', type=int, metavar='N',
+                        help='Max pages/chapters synced in parallel (default: sync.concurrency)')
+    parser.add_argument('--render-workers', type=int, metavar='N',
+                        help='Render pages in N forked processes (default: sync.render_workers, '
+                             '0 renders on the sync threads)')
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Parse audit files and compile templates without the on-disk caches')
+    parser.add_argument('--timings', action='store_true', help='Report startup and phase timings')
+    parser.add_argument('--profile', nargs='?', const='profile', metavar='DIR',
+                        help='Profile each phase, writing cProfile stats and collapsed stacks '
+                             'to DIR (default: ./profile); implies --concurrency 1 and no '
+                             'render workers')
     
     args = parser.parse_args()
     
@@ -483,26 +3913,60 @@ def main():
     if not config_path.is_absolute():
         config_path = Path(__file__).parent / args.config
     
-    updater = BookStackUpdater(str(config_path))
+    updater = BookStackUpdater(str(config_path), use_cache=not args.no_cache)
     updater.dry_run = args.dry_run
+    updater.full = args.full
+    if args.concurrency:
+        updater.concurrency = max(1, args.concurrency)
+    if args.render_workers is not None:
+        updater.render_workers = max(0, args.render_workers)
+    
+    if args.profile:
+        profiler = PhaseProfiler(Path(args.profile).expanduser())
+        updater.concurrency = 1
+        updater.render_workers = 0
+    
+    def finish(code: int):
+        if profiler:
+            profiler.finish()
+        updater.export_metrics()
+        updater.close()
+        if args.timings:
+            timings.report()
+        sys.exit(code)
     
     # Run audit if requested
     if args.audit:
-        if not updater.run_audit():
+        with timings.phase('audit'):
+            audited = updater.run_audit()
+        if not audited:
             logger.error("Audit failed")
-            sys.exit(1)
+            finish(1)
+    
+    if args.watch:
+        try:
+            updater.watch()
+        except KeyboardInterrupt:
+            logger.info("Watch stopped")
+        finish(0)
     
     # Update docs if requested
-    stats = {'created': 0, 'updated': 0, 'errors': 0}
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'errors': 0}
     if args.update:
-        stats = updater.update_docs()
+        with timings.phase('update docs'):
+            stats = updater.update_docs()
         logger.info(f"Update complete: {stats}")
+    elif args.flush:
+        with timings.phase('flush outbox'):
+            stats = updater.flush_outbox()
+        logger.info(f"Flush complete: {stats}")
     
     # Send notification if requested
     if args.notify:
-        updater.send_notification(stats)
+        with timings.phase('notify'):
+            updater.send_notification(stats)
     
-    sys.exit(0 if stats['errors'] == 0 else 1)
+    finish(0 if stats['errors'] == 0 and not updater.audit_failed else 1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,492 @@
+"""
+Fake BookStack, Proxmox and Kubernetes APIs and synthetic audit data,
+shared by the tests and the benchmarks.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+HERE = Path(__file__).resolve().parent
+
+# Size of the real homelab at scale 1
+BASE_CLUSTER = {
+    'proxmox_nodes': 3,
+    'vms': 12,
+    'k3s_nodes': 5,
+    'namespaces': 15,
+    'deployments': 40,
+    'services': 50,
+    'ingresses': 20,
+}
+
+
+class FakeBookStack:
+    """In-process stand-in for the BookStack REST API
+
+    Supports the book/chapter/page endpoints the updater uses, with
+    count/offset pagination and filter[...] parameters. Latency and 429/5xx
+    responses can be injected, and every request and byte is counted.
+    With `rate_limit`, requests beyond that many per minute get a 429 and
+    every response carries X-RateLimit-* headers, like BookStack's throttle.
+    """
+
+    COLLECTIONS = ('books', 'chapters', 'pages')
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, rate_limit: int = 0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self._window = (0, 0)  # (minute, requests in it)
+        self.items: Dict[str, Dict[int, Dict]] = {name: {} for name in self.COLLECTIONS}
+        self.requests: Dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._next_id = 1
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    def start(self) -> 'FakeBookStack':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def _count(self, method: str, path: str, bytes_in: int):
+        # Collapse ids so counts group by endpoint: GET /api/pages/:id
+        endpoint = f"{method} " + re.sub(r'/\d+', '/:id', path)
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes_in += bytes_in
+
+    def _rate_limit_headers(self) -> Dict[str, str]:
+        """Count a request against the per-minute window; empty if unlimited"""
+        if not self.rate_limit:
+            return {}
+        now = time.time()
+        minute = int(now // 60)
+        with self._lock:
+            start, used = self._window
+            used = used + 1 if start == minute else 1
+            self._window = (minute, used)
+        headers = {'X-RateLimit-Limit': str(self.rate_limit),
+                   'X-RateLimit-Remaining': str(max(0, self.rate_limit - used))}
+        if used > self.rate_limit:
+            headers['Retry-After'] = str(int((minute + 1) * 60 - now) + 1)
+        return headers
+
+    def _injected_failure(self) -> int:
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 503
+        return 0
+
+    def _create(self, kind: str, data: Dict) -> Dict:
+        with self._lock:
+            item = dict(data, id=self._next_id)
+            self._next_id += 1
+            if kind == 'pages' and item.get('chapter_id') in self.items['chapters']:
+                item['book_id'] = self.items['chapters'][item['chapter_id']]['book_id']
+            self.items[kind][item['id']] = item
+        return item
+
+    def _list(self, kind: str, params: Dict[str, str]) -> Dict:
+        items = list(self.items[kind].values())
+        for key, value in params.items():
+            match = re.fullmatch(r'filter\[(\w+)\]', key)
+            if match:
+                items = [i for i in items if str(i.get(match.group(1))) == value]
+        offset = int(params.get('offset', 0))
+        count = min(int(params.get('count', 100)), 500)
+        # Like BookStack, listings carry metadata only, never page bodies
+        data = [{k: v for k, v in item.items() if k not in ('markdown', 'html')}
+                for item in items[offset:offset + count]]
+        return {'data': data, 'total': len(items)}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            rate_headers: Dict[str, str] = {}
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: Any = None, headers: Dict[str, str] = None):
+                payload = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in {**self.rate_headers, **(headers or {})}.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+                with fake._lock:
+                    fake.bytes_out += len(payload)
+
+            def _dispatch(self, method: str):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                fake._count(method, parts.path, len(raw))
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                self.rate_headers = fake._rate_limit_headers()
+                if 'Retry-After' in self.rate_headers:
+                    return self._send(429, {'error': {'message': 'Too Many Attempts.'}})
+
+                status = fake._injected_failure()
+                if status == 429:
+                    return self._send(429, {'error': {'message': 'Too Many Attempts.'}},
+                                      {'Retry-After': '1', 'X-RateLimit-Limit': '180',
+                                       'X-RateLimit-Remaining': '0'})
+                if status:
+                    return self._send(status, {'error': {'message': 'Injected failure'}})
+
+                match = re.fullmatch(r'/api/(books|chapters|pages)(?:/(\d+))?', parts.path)
+                if not match:
+                    return self._send(404, {'error': {'message': 'Not found'}})
+                kind, item_id = match.group(1), match.group(2)
+                data = json.loads(raw) if raw else {}
+
+                if method == 'GET' and item_id is None:
+                    return self._send(200, fake._list(kind, dict(parse_qsl(parts.query))))
+                if method == 'POST' and item_id is None:
+                    return self._send(200, fake._create(kind, data))
+                item = fake.items[kind].get(int(item_id)) if item_id else None
+                if item is None:
+                    return self._send(404, {'error': {'message': 'Not found'}})
+                if method == 'GET':
+                    return self._send(200, item)
+                if method == 'PUT':
+                    with fake._lock:
+                        item.update(data)
+                    return self._send(200, item)
+                if method == 'DELETE':
+                    with fake._lock:
+                        fake.items[kind].pop(item['id'], None)
+                    return self._send(204)
+                return self._send(405, {'error': {'message': 'Method not allowed'}})
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def do_PUT(self):
+                self._dispatch('PUT')
+
+            def do_DELETE(self):
+                self._dispatch('DELETE')
+
+        return Handler
+
+
+class FakeInventoryAPI:
+    """Minimal read-only JSON API server for the audit collector fakes
+
+    Subclasses implement route(path, params, headers) -> (status, body).
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def route(self, path: str, params: Dict[str, str], headers) -> Tuple[int, Any]:
+        raise NotImplementedError
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.request_count += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                parts = urlsplit(self.path)
+                status, body = fake.route(parts.path, dict(parse_qsl(parts.query)), self.headers)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+class FakeProxmox(FakeInventoryAPI):
+    """Proxmox VE `/api2/json/cluster/resources` with `type` filtering"""
+
+    def __init__(self, nodes: List[Dict], vms: List[Dict], **kwargs):
+        super().__init__(**kwargs)
+        self.resources = nodes + vms
+
+    def route(self, path, params, headers):
+        if not headers.get('Authorization', '').startswith('PVEAPIToken='):
+            return 401, {'data': None}
+        if path != '/api2/json/cluster/resources':
+            return 404, {'data': None}
+        kind = params.get('type')
+        data = [r for r in self.resources
+                if kind is None or r['type'] == kind or (kind == 'vm' and r['type'] in ('qemu', 'lxc'))]
+        return 200, {'data': data}
+
+
+class FakeKubernetes(FakeInventoryAPI):
+    """Kubernetes list endpoints with `limit`/`continue` chunking
+
+    The next `expire_continue` requests carrying a continue token get 410 Gone,
+    like a token whose resource version was compacted away.
+    """
+
+    def __init__(self, objects: Dict[str, List[Dict]], expire_continue: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.expire_continue = expire_continue
+        # bookstack_updater's source -> path map, served from the synthetic objects
+        from bookstack_updater import KubernetesCollector
+        self.lists = {path: objects.get(source, []) for source, path in KubernetesCollector.RESOURCES.items()}
+
+    def route(self, path, params, headers):
+        if not headers.get('Authorization', '').startswith('Bearer '):
+            return 401, {'kind': 'Status', 'code': 401}
+        if path not in self.lists:
+            return 404, {'kind': 'Status', 'code': 404}
+        if params.get('continue'):
+            with self._lock:
+                expired = self.expire_continue > 0
+                self.expire_continue -= expired
+            if expired:
+                return 410, {'kind': 'Status', 'code': 410, 'reason': 'Expired'}
+        items = self.lists[path]
+        start = int(params.get('continue') or 0)
+        limit = int(params.get('limit') or len(items) or 1)
+        end = start + limit
+        return 200, {
+            'kind': 'List',
+            'metadata': {'continue': str(end) if end < len(items) else ''},
+            'items': items[start:end],
+        }
+
+
+def _table(header: List[str], rows: List[List[Any]]) -> str:
+    """Render a kubectl-style whitespace aligned table"""
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    lines = []
+    for row in [header] + rows:
+        lines.append('   '.join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip())
+    return '\n'.join(lines) + '\n'
+
+
+def generate_audit_data(results_dir: Path, scale: int = 1, seed: int = 0, k3s_format: str = 'txt'):
+    """Write synthetic proxmox-*.json and k3s-* results at `scale` x our cluster
+
+    `k3s_format` is 'txt' for kubectl tables or 'json' for `kubectl get -o json` lists.
+    Returns the same inventory as raw API objects, keyed by source.
+    """
+    rng = random.Random(seed)
+    size = {key: max(1, count * scale) for key, count in BASE_CLUSTER.items()}
+    results_dir.mkdir(parents=True, exist_ok=True)
+    gib = 1024 ** 3
+
+    nodes = [{
+        'type': 'node',
+        'node': f'pve{i}',
+        'ip': f'10.0.0.{10 + i % 240}',
+        'status': 'online',
+        'cpu': round(rng.random(), 4),
+        'mem': rng.randint(4, 60) * gib,
+        'maxmem': 64 * gib,
+        'disk': rng.randint(50, 800) * gib,
+        'maxdisk': 1024 * gib,
+        'uptime': rng.randint(3600, 90 * 86400),
+        'maxcpu': 16,
+    } for i in range(size['proxmox_nodes'])]
+    (results_dir / 'proxmox-nodes.json').write_text(json.dumps(nodes))
+
+    vms = [{
+        'type': 'qemu',
+        'name': f'vm-{i:05d}',
+        'vmid': 100 + i,
+        'status': 'running' if rng.random() < 0.85 else 'stopped',
+        'ip': f'10.0.{1 + i // 250}.{i % 250}',
+        'cpus': rng.choice([1, 2, 4, 8]),
+        'maxmem': rng.choice([1, 2, 4, 8, 16]) * gib,
+        'node': nodes[i % len(nodes)]['node'],
+        'description': f'synthetic workload {i}',
+    } for i in range(size['vms'])]
+    for vm in vms:
+        running = vm['status'] == 'running'
+        vm.update(
+            cpu=round(rng.random(), 4) if running else 0,
+            mem=int(vm['maxmem'] * rng.uniform(0.2, 0.9)) if running else 0,
+            disk=rng.randint(2, 64) * gib,
+            uptime=rng.randint(600, 60 * 86400) if running else 0,
+        )
+    (results_dir / 'proxmox-vms.json').write_text(json.dumps(vms))
+
+    namespaces = [f'ns-{i:04d}' for i in range(size['namespaces'])]
+    k8s = _k3s_objects(size, namespaces)
+    inventory = {'proxmox-nodes': nodes, 'proxmox-vms': vms, **k8s}
+    if k3s_format == 'json':
+        for source, items in k8s.items():
+            (results_dir / f'{source}.json').write_text(
+                json.dumps({'apiVersion': 'v1', 'kind': 'List', 'items': items})
+            )
+        return inventory
+    (results_dir / 'k3s-nodes.txt').write_text(_table(
+        ['NAME', 'STATUS', 'ROLES', 'AGE', 'VERSION', 'INTERNAL-IP'],
+        [[f'k3s-{i}', 'Ready', 'control-plane,etcd,master' if i < 3 else '<none>', '90d',
+          'v1.33.3+k3s1', f'10.0.1.{10 + i % 240}'] for i in range(size['k3s_nodes'])]
+    ))
+    (results_dir / 'k3s-namespaces.txt').write_text(_table(
+        ['NAME', 'STATUS', 'AGE'],
+        [[ns, 'Active', '90d'] for ns in namespaces]
+    ))
+    (results_dir / 'k3s-deployments.txt').write_text(_table(
+        ['NAMESPACE', 'NAME', 'READY', 'IMAGE'],
+        [[namespaces[i % len(namespaces)], f'app-{i:05d}', '1/1', f'registry.local/app-{i}:1.0']
+         for i in range(size['deployments'])]
+    ))
+    (results_dir / 'k3s-services.txt').write_text(_table(
+        ['NAMESPACE', 'NAME', 'TYPE', 'CLUSTER-IP', 'EXTERNAL-IP', 'PORT(S)', 'AGE'],
+        [[namespaces[i % len(namespaces)], f'svc-{i:05d}', 'ClusterIP',
+          f'10.43.{i // 250}.{i % 250}', '<none>', '80/TCP', '90d']
+         for i in range(size['services'])]
+    ))
+    (results_dir / 'k3s-ingresses.txt').write_text(_table(
+        ['NAMESPACE', 'NAME', 'CLASS', 'HOSTS', 'ADDRESS', 'PORTS', 'AGE'],
+        [[namespaces[i % len(namespaces)], f'ing-{i:05d}', 'traefik',
+          f'app-{i}.cluster.local', '10.0.2.31', '80', '90d']
+         for i in range(size['ingresses'])]
+    ))
+    return inventory
+
+
+def _k3s_objects(size: Dict[str, int], namespaces: List[str]) -> Dict[str, List[Dict]]:
+    """Synthetic Kubernetes API objects for each k3s source"""
+    objects = {}
+    objects['k3s-nodes'] = [{
+        'metadata': {
+            'name': f'k3s-{i}',
+            'labels': {'node-role.kubernetes.io/control-plane': 'true'} if i < 3 else {},
+        },
+        'status': {
+            'conditions': [{'type': 'Ready', 'status': 'True'}],
+            'addresses': [{'type': 'InternalIP', 'address': f'10.0.1.{10 + i % 240}'}],
+            'nodeInfo': {'kubeletVersion': 'v1.33.3+k3s1'},
+        },
+    } for i in range(size['k3s_nodes'])]
+    objects['k3s-namespaces'] = [
+        {'metadata': {'name': ns}, 'status': {'phase': 'Active'}} for ns in namespaces
+    ]
+    objects['k3s-deployments'] = [{
+        'metadata': {'namespace': namespaces[i % len(namespaces)], 'name': f'app-{i:05d}'},
+        'spec': {'replicas': 1, 'template': {'spec': {'containers': [{'image': f'registry.local/app-{i}:1.0'}]}}},
+        'status': {'readyReplicas': 1},
+    } for i in range(size['deployments'])]
+    objects['k3s-services'] = [{
+        'metadata': {'namespace': namespaces[i % len(namespaces)], 'name': f'svc-{i:05d}'},
+        'spec': {'type': 'ClusterIP', 'clusterIP': f'10.43.{i // 250}.{i % 250}',
+                 'ports': [{'port': 80, 'protocol': 'TCP'}]},
+    } for i in range(size['services'])]
+    objects['k3s-ingresses'] = [{
+        'metadata': {'namespace': namespaces[i % len(namespaces)], 'name': f'ing-{i:05d}'},
+        'spec': {'ingressClassName': 'traefik', 'rules': [{'host': f'app-{i}.cluster.local'}]},
+        'status': {'loadBalancer': {'ingress': [{'ip': '10.0.2.31'}]}},
+    } for i in range(size['ingresses'])]
+    return objects
+
+
+def write_config(workdir: Path, results_dir: Path, bookstack_url: str,
+                 concurrency: int = 4, native_urls: List[str] = (), rate_limit: int = 0,
+                 standby_url: str = '', targets: List[str] = ('bookstack',),
+                 render_workers: int = 0) -> Path:
+    """Write an updater config pointing at the fake server and synthetic data
+
+    `native_urls` are (proxmox, kubernetes) fake URLs for the in-process collectors.
+    `targets` are the publish targets: bookstack, standby (a second fake at
+    `standby_url`) and filesystem (markdown under the workdir).
+    """
+    import yaml
+
+    config = yaml.safe_load((HERE / 'config.yaml.example').read_text())
+    # The client's limiter matches the fake's; 0 leaves both unlimited
+    config['bookstack'].update(url=bookstack_url, api_token_id='bench', api_token_secret='bench',
+                               rate_limit=rate_limit)
+    config['audit'] = {'script': '/bin/true', 'results_dir': str(results_dir)}
+    if native_urls:
+        proxmox_url, kubernetes_url = native_urls
+        config['audit']['native'] = {
+            'proxmox': {'url': proxmox_url, 'token_id': 'bench@pve!bench', 'token_secret': 'bench'},
+            'kubernetes': {'server': kubernetes_url, 'token': 'bench', 'chunk_size': 100},
+        }
+    config['cache'] = {'dir': str(workdir / 'cache')}
+    config.setdefault('sync', {}).update(concurrency=concurrency, render_workers=render_workers)
+    publish = {
+        'bookstack': {'name': 'bookstack', 'type': 'bookstack'},
+        'standby': {'name': 'standby', 'type': 'bookstack', 'url': standby_url},
+        'filesystem': {'name': 'docs', 'type': 'filesystem', 'path': str(workdir / 'docs')},
+    }
+    config['publish'] = [publish[target] for target in targets]
+    config['discord'] = {'enabled': False}
+
+    templates = workdir / 'templates'
+    if not templates.exists():
+        templates.symlink_to(HERE / 'templates')
+    path = workdir / 'config.yaml'
+    path.write_text(yaml.safe_dump(config))
+    return path
@@ -2,14 +2,20 @@
 """
 BookStack Initialization Script
 Sets up initial book/chapter structure and creates API token
+
+Safe to re-run: the existing structure is read once through the REST API
+and only missing books and chapters are created.
 """
+import argparse
 import requests
 import re
-import json
 import yaml
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from bookstack_updater import BookStackAPI
+
 BOOKSTACK_URL = "http://docs.cluster.local"
 DEFAULT_EMAIL = "admin@admin.com"
 DEFAULT_PASSWORD = os.getenv("BOOKSTACK_DEFAULT_PASSWORD", "password")
@@ -60,12 +66,6 @@ class BookStackSession:
         print(f"Login failed - status: {resp.status_code}")
         return False
 
-    def _get_page_token(self, url: str) -> str:
-        """Get CSRF token from any authenticated page"""
-        resp = self.session.get(url)
-        resp.raise_for_status()
-        return self._get_csrf_token(resp.text)
-
     def create_api_token(self, name: str = "Automation") -> dict:
         """Create API token through web interface"""
         # Go to API tokens page
@@ -106,183 +106,205 @@ class BookStackSession:
         print(f"Failed to create API token - status: {resp.status_code}")
         return None
 
-    def create_book(self, name: str, description: str = "") -> dict:
-        """Create a book"""
-        token = self._get_page_token(f"{self.base_url}/create-book")
-
-        resp = self.session.post(
-            f"{self.base_url}/books",
-            data={
-                "_token": token,
-                "name": name,
-                "description": description,
-                "tags": []
-            },
-            allow_redirects=False
-        )
-
-        if resp.status_code in (302, 303):
-            location = resp.headers.get('Location', '')
-            slug = location.rstrip('/').split('/')[-1]
-            print(f"Created book: {name} (slug: {slug})")
-            return {"name": name, "slug": slug}
-
-        print(f"Failed to create book '{name}' - status: {resp.status_code}")
-        return None
-
-    def create_chapter(self, book_slug: str, name: str, description: str = "") -> dict:
-        """Create a chapter in a book using form submission"""
-        # First get the create chapter page
-        create_url = f"{self.base_url}/books/{book_slug}/create-chapter"
-        resp = self.session.get(create_url)
-        if resp.status_code != 200:
-            print(f"  Cannot access chapter creation page for {book_slug}")
-            return None
-
-        token = self._get_csrf_token(resp.text)
-
-        # Find book ID from the form
-        book_id_match = re.search(r'name="book_id"\s+value="(\d+)"', resp.text)
-        book_id = book_id_match.group(1) if book_id_match else None
 
-        if not book_id:
-            # Try to get book ID from books list
-            books_resp = self.session.get(f"{self.base_url}/books/{book_slug}")
-            book_id_match = re.search(r'/books/(\d+)', books_resp.text)
-            book_id = book_id_match.group(1) if book_id_match else "1"
-
-        # Submit as a form post with proper content type
-        resp = self.session.post(
-            create_url,
-            data={
-                "_token": token,
-                "name": name,
-                "description_html": description,
-                "description": description,
-                "book_id": book_id
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            allow_redirects=True
-        )
-
-        # Check if chapter was created by looking for it in the response
-        if name in resp.text and resp.status_code == 200:
-            print(f"  Created chapter: {name}")
-            return {"name": name, "slug": name.lower().replace(" ", "-")}
-
-        # Also check if we got redirected to the chapter page
-        if f"/chapter/" in resp.url:
-            slug = resp.url.rstrip('/').split('/')[-1]
-            print(f"  Created chapter: {name} (slug: {slug})")
-            return {"name": name, "slug": slug}
-
-        print(f"  Failed to create chapter '{name}' - status: {resp.status_code}")
-        return None
-
-    def get_books(self) -> list:
-        """Get list of existing books"""
-        resp = self.session.get(f"{self.base_url}/api/books")
-        if resp.status_code == 200:
-            return resp.json().get("data", [])
-        return []
+# Initial structure: book -> description and chapters
+STRUCTURE = {
+    "Infrastructure": {
+        "description": "Core infrastructure documentation",
+        "chapters": [
+            "Network Topology",
+            "Proxmox Nodes",
+            "Virtual Machines",
+            "DNS & Routing"
+        ]
+    },
+    "K3s Cluster": {
+        "description": "Kubernetes cluster documentation",
+        "chapters": [
+            "Cluster Overview",
+            "Deployments",
+            "Services & Ingress",
+            "Storage"
+        ]
+    },
+    "Runbooks": {
+        "description": "Operational runbooks and procedures",
+        "chapters": [
+            "Incident Response",
+            "Backup & Recovery",
+            "Maintenance",
+            "Troubleshooting"
+        ]
+    },
+    "Services": {
+        "description": "Documentation for deployed services",
+        "chapters": [
+            "Monitoring (Grafana/Prometheus)",
+            "Dashboard (Homer/Homarr)",
+            "DNS (AdGuard)",
+            "GPT-OS"
+        ]
+    }
+}
+
+
+def reconcile(api: BookStackAPI, structure: dict, workers: int = 4, dry_run: bool = False) -> dict:
+    """Create the books and chapters of `structure` that do not exist yet
+
+    The existing tree is read with one books and one chapters listing, then
+    missing books and after them missing chapters are created concurrently
+    over the API client's pooled session. Names match case-insensitively.
+    """
+    books = {}
+    for book in api.iter_list('books', fields=('id', 'name')):
+        books.setdefault(book['name'].lower(), book['id'])
+    chapters = {
+        (chapter['book_id'], chapter['name'].lower())
+        for chapter in api.iter_list('chapters', fields=('book_id', 'name'))
+    }
+    stats = {"books_created": 0, "chapters_created": 0, "existing": 0, "errors": 0}
+
+    def create_all(create, items, label):
+        """Run create(*args) for each (label, args) concurrently; return label -> result"""
+        if dry_run:
+            for name, _ in items:
+                print(f"  Would create {label}: {name}")
+            return {}
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [(name, pool.submit(create, *args)) for name, args in items]
+            for name, future in futures:
+                try:
+                    results[name] = future.result()
+                    print(f"  Created {label}: {name}")
+                except Exception as e:
+                    stats["errors"] += 1
+                    print(f"  Failed to create {label} '{name}': {e}")
+        return results
+
+    missing_books = [
+        (name, (name, info["description"]))
+        for name, info in structure.items() if name.lower() not in books
+    ]
+    stats["existing"] += len(structure) - len(missing_books)
+    for name, book in create_all(api.create_book, missing_books, "book").items():
+        books[name.lower()] = book["id"]
+        stats["books_created"] += 1
+
+    missing_chapters = []
+    for book_name, info in structure.items():
+        book_id = books.get(book_name.lower())
+        for chapter_name in info["chapters"]:
+            if book_id is not None and (book_id, chapter_name.lower()) in chapters:
+                stats["existing"] += 1
+            elif book_id is not None or dry_run:
+                missing_chapters.append((f"{book_name} / {chapter_name}", (book_id, chapter_name)))
+    stats["chapters_created"] = len(create_all(api.create_chapter, missing_chapters, "chapter"))
+    return stats
 
 
 def main():
-    print(f"Connecting to BookStack at {BOOKSTACK_URL}...")
-
-    client = BookStackSession(BOOKSTACK_URL)
+    parser = argparse.ArgumentParser(description='BookStack Initialization')
+    parser.add_argument('--config', '-c', default=str(Path(__file__).parent / 'config.yaml'),
+                        help='Updater config to read and store API credentials in')
+    parser.add_argument('--url', help=f'BookStack URL (default: config bookstack.url or {BOOKSTACK_URL})')
+    parser.add_argument('--reconcile', '-r', action='store_true',
+                        help='Only create missing books/chapters with the configured API token')
+    parser.add_argument('--workers', '-j', type=int, default=4, help='Concurrent creates (default: 4)')
+    parser.add_argument('--dry-run', '-n', action='store_true', help='Show what would be created')
+    args = parser.parse_args()
+
+    config_path = Path(args.config).expanduser()
+    config = {}
+    if config_path.exists():
+        with open(config_path) as f:
+            config = yaml.safe_load(f) or {}
+    bookstack = config.get('bookstack', {})
+    url = args.url or bookstack.get('url') or BOOKSTACK_URL
+    api_token = None
+    if bookstack.get('api_token_id') and bookstack.get('api_token_secret'):
+        api_token = {"id": bookstack['api_token_id'], "secret": bookstack['api_token_secret']}
+
+    print(f"Connecting to BookStack at {url}...")
+
+    if api_token is None:
+        if args.reconcile:
+            print(f"No API token in {config_path}; run without --reconcile to create one")
+            return 1
+
+        client = BookStackSession(url)
+
+        # Login
+        if not client.login(DEFAULT_EMAIL, DEFAULT_PASSWORD):
+            print("Failed to login to BookStack")
+            return 1
+
+        # Create API token
+        print("\nCreating API token for automation...")
+        api_token = client.create_api_token("Homelab-Automation")
+        if not api_token:
+            print("Cannot create the book structure without an API token")
+            return 1
 
-    # Login
-    if not client.login(DEFAULT_EMAIL, DEFAULT_PASSWORD):
-        print("Failed to login to BookStack")
-        return 1
-
-    # Check existing books
-    print("\nChecking existing content...")
-
-    # Define initial structure
-    structure = {
-        "Infrastructure": {
-            "description": "Core infrastructure documentation",
-            "chapters": [
-                "Network Topology",
-                "Proxmox Nodes",
-                "Virtual Machines",
-                "DNS & Routing"
-            ]
-        },
-        "K3s Cluster": {
-            "description": "Kubernetes cluster documentation",
-            "chapters": [
-                "Cluster Overview",
-                "Deployments",
-                "Services & Ingress",
-                "Storage"
-            ]
-        },
-        "Runbooks": {
-            "description": "Operational runbooks and procedures",
-            "chapters": [
-                "Incident Response",
-                "Backup & Recovery",
-                "Maintenance",
-                "Troubleshooting"
-            ]
-        },
-        "Services": {
-            "description": "Documentation for deployed services",
-            "chapters": [
-                "Monitoring (Grafana/Prometheus)",
-                "Dashboard (Homer/Homarr)",
-                "DNS (AdGuard)",
-                "GPT-OS"
-            ]
-        }
-    }
+        print(f"\nAPI Token Created:")
+        print(f"  Token ID: {api_token['id']}")
+        print(f"  Token Secret: {api_token['secret']}")
+        save_credentials(config_path, url, api_token)
+    else:
+        print(f"Using API token from {config_path}")
 
     # Create books and chapters
-    print("\nCreating book structure...")
-    created_books = {}
+    print("\nReconciling book structure...")
+    api = BookStackAPI.from_config({
+        **bookstack,
+        'url': url,
+        'api_token_id': api_token['id'],
+        'api_token_secret': api_token['secret']
+    })
+    try:
+        stats = reconcile(api, STRUCTURE, workers=args.workers, dry_run=args.dry_run)
+    except requests.RequestException as e:
+        print(f"Failed to read the existing structure: {e}")
+        return 1
+    finally:
+        api.close()
+    print(f"\nBooks created: {stats['books_created']}, chapters created: "
+          f"{stats['chapters_created']}, already present: {stats['existing']}, "
+          f"errors: {stats['errors']}")
 
-    for book_name, book_info in structure.items():
-        book = client.create_book(book_name, book_info["description"])
-        if book:
-            created_books[book_name] = book
-            for chapter_name in book_info["chapters"]:
-                client.create_chapter(book["slug"], chapter_name)
+    print("\n" + "="*50)
+    print("BookStack initialization complete!")
+    print(f"Access BookStack at: {url}")
+    print(f"Login: {DEFAULT_EMAIL} / {DEFAULT_PASSWORD}")
+    print("="*50)
 
-    # Create API token
-    print("\nCreating API token for automation...")
-    api_token = client.create_api_token("Homelab-Automation")
+    return 0 if stats["errors"] == 0 else 1
 
-    if api_token:
-        print(f"\nAPI Token Created:")
-        print(f"  Token ID: {api_token['id']}")
-        print(f"  Token Secret: {api_token['secret']}")
 
-        # Save to config file
-        config_path = Path(__file__).parent / "config.yaml"
-        if config_path.exists():
-            with open(config_path) as f:
-                config = yaml.safe_load(f)
+def save_credentials(config_path: Path, url: str, api_token: dict):
+    """Store a newly created API token in the config and the credentials reference"""
+    # Save to config file
+    if config_path.exists():
+        with open(config_path) as f:
+            config = yaml.safe_load(f)
 
-            config['bookstack']['api_token_id'] = api_token['id']
-            config['bookstack']['api_token_secret'] = api_token['secret']
+        config['bookstack']['api_token_id'] = api_token['id']
+        config['bookstack']['api_token_secret'] = api_token['secret']
 
-            with open(config_path, 'w') as f:
-                yaml.dump(config, f, default_flow_style=False)
+        with open(config_path, 'w') as f:
+            yaml.dump(config, f, default_flow_style=False)
 
-            print(f"\nUpdated {config_path} with API credentials")
+        print(f"\nUpdated {config_path} with API credentials")
 
     # Save credentials reference
     creds_path = Path.home() / "Forge" / "bookstack-config.yaml"
     creds = {
         "bookstack": {
-            "url": BOOKSTACK_URL,
+            "url": url,
             "admin_email": DEFAULT_EMAIL,
             "admin_password": DEFAULT_PASSWORD,
-            "api_token_id": api_token['id'] if api_token else "",
-            "api_token_secret": api_token['secret'] if api_token else ""
+            "api_token_id": api_token['id'],
+            "api_token_secret": api_token['secret']
         }
     }
 
@@ -291,14 +313,6 @@ def main():
     os.chmod(creds_path, 0o600)
     print(f"Saved credentials to {creds_path}")
 
-    print("\n" + "="*50)
-    print("BookStack initialization complete!")
-    print(f"Access BookStack at: {BOOKSTACK_URL}")
-    print(f"Login: {DEFAULT_EMAIL} / {DEFAULT_PASSWORD}")
-    print("="*50)
-
-    return 0
-
 
 if __name__ == "__main__":
     exit(main())
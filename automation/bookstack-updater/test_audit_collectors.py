@@ -0,0 +1,126 @@
+"""Integration tests for the in-process audit collectors against the fake APIs in fakes.py"""
+
+import math
+from pathlib import Path
+
+import pytest
+import requests
+import yaml
+
+import fakes
+from bookstack_updater import AuditCollector, AuditDataParser, BookStackUpdater, KubernetesCollector
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    """Synthetic inventory as raw API objects, also written as results files to tmp_path/files"""
+    return fakes.generate_audit_data(tmp_path / 'files', scale=2, k3s_format='json')
+
+
+@pytest.fixture
+def proxmox(inventory):
+    fake = fakes.FakeProxmox(inventory['proxmox-nodes'], inventory['proxmox-vms']).start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def kubernetes(inventory):
+    fake = fakes.FakeKubernetes(inventory).start()
+    yield fake
+    fake.stop()
+
+
+def make_updater(tmp_path: Path, results_dir: Path, proxmox_url: str, kubernetes_url: str,
+                 **kubernetes_config) -> BookStackUpdater:
+    """An updater whose audit runs only the native collectors against the given URLs"""
+    path = fakes.write_config(tmp_path, results_dir, 'http://127.0.0.1:9',
+                                  native_urls=[proxmox_url, kubernetes_url])
+    config = yaml.safe_load(path.read_text())
+    config['audit']['native']['kubernetes'].update(kubernetes_config)
+    path.write_text(yaml.safe_dump(config))
+    return BookStackUpdater(str(path))
+
+
+def test_native_rows_match_results_files(tmp_path, proxmox, kubernetes):
+    updater = make_updater(tmp_path, tmp_path / 'native', proxmox.url, kubernetes.url)
+    assert updater.run_audit()
+    assert not updater.audit_failed
+    assert not list((tmp_path / 'native').iterdir())
+
+    from_files = AuditDataParser(str(tmp_path / 'files'))
+    for key, method in BookStackUpdater.CONTEXT_PARSERS.items():
+        rows = getattr(updater.parser, method)()
+        assert rows, key
+        assert rows == getattr(from_files, method)(), key
+
+
+def test_list_objects_follows_continue_tokens(inventory, kubernetes):
+    collector = KubernetesCollector(kubernetes.url, 'token', chunk_size=7)
+    items = collector.list_objects(KubernetesCollector.RESOURCES['k3s-deployments'])
+    collector.close()
+
+    assert items == inventory['k3s-deployments']
+    assert kubernetes.request_count == math.ceil(len(items) / 7) > 1
+
+
+def test_expired_continue_token_restarts_the_list(inventory, kubernetes):
+    kubernetes.expire_continue = 1
+    collector = KubernetesCollector(kubernetes.url, 'token', chunk_size=7)
+    items = collector.list_objects(KubernetesCollector.RESOURCES['k3s-deployments'])
+    collector.close()
+
+    assert items == inventory['k3s-deployments']
+    # The first chunk, the 410, then the whole list again
+    assert kubernetes.request_count == 2 + math.ceil(len(items) / 7)
+
+
+def test_list_expiring_twice_fails(kubernetes):
+    kubernetes.expire_continue = 2
+    collector = KubernetesCollector(kubernetes.url, 'token', chunk_size=7)
+    with pytest.raises(requests.HTTPError):
+        collector.list_objects(KubernetesCollector.RESOURCES['k3s-deployments'])
+    collector.close()
+
+
+def test_failed_source_falls_back_to_results_file(tmp_path, proxmox, kubernetes):
+    # Proxmox answers 404 under this prefix; the results dir holds the previous audit
+    results_dir = tmp_path / 'files'
+    updater = make_updater(tmp_path, results_dir, proxmox.url + '/gone', kubernetes.url)
+    assert updater.run_audit()
+    assert updater.audit_failed
+    failed = {result['name'] for result in updater.audit_results if result['returncode'] != 0}
+    assert failed == {'proxmox:proxmox-nodes', 'proxmox:proxmox-vms'}
+
+    from_files = AuditDataParser(str(results_dir))
+    assert 'proxmox-nodes' not in updater.parser.native
+    assert updater.parser.get_proxmox_nodes() == from_files.get_proxmox_nodes()
+    assert updater.parser.get_vms() == from_files.get_vms()
+    assert 'k3s-deployments' in updater.parser.native
+
+
+def test_collector_setup_error_is_a_failed_result(tmp_path, proxmox, kubernetes):
+    updater = make_updater(tmp_path, tmp_path / 'files', proxmox.url, kubernetes.url,
+                           token=None, token_file=str(tmp_path / 'missing-token'))
+    assert updater.run_audit()
+    failed = [result for result in updater.audit_results if result['returncode'] != 0]
+    assert [result['name'] for result in failed] == ['kubernetes']
+    assert 'missing-token' in failed[0]['error']
+    assert updater.parser.get_k3s_deployments() == AuditDataParser(
+        str(tmp_path / 'files')).get_k3s_deployments()
+
+
+def test_command_that_cannot_start_leaves_no_partial_file(tmp_path):
+    collector = AuditCollector('missing', [str(tmp_path / 'no-such-command')], 'missing.json')
+    result = collector.run(tmp_path)
+    assert result['returncode'] is None
+    assert result['error']
+    assert not list(tmp_path.iterdir())
+
+
+def test_native_without_known_sources_fails_the_audit(tmp_path):
+    path = fakes.write_config(tmp_path, tmp_path / 'results', 'http://127.0.0.1:9')
+    config = yaml.safe_load(path.read_text())
+    config['audit']['native'] = {'vmware': {'url': 'https://vcenter'}}
+    path.write_text(yaml.safe_dump(config))
+    assert not BookStackUpdater(str(path)).run_audit()
@@ -0,0 +1,62 @@
+"""Tests for BookStackAPI throttling against the fake BookStack API"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+import fakes
+from bookstack_updater import BookStackAPI
+
+
+@pytest.fixture
+def bookstack():
+    fake = fakes.FakeBookStack().start()
+    yield fake
+    fake.stop()
+
+
+def throttle_first(fake: fakes.FakeBookStack, count: int) -> list:
+    """Answer the first `count` requests 429 (Retry-After: 1); returns request arrival times"""
+    arrivals = []
+    injected = fake._injected_failure
+
+    def failure():
+        arrivals.append(time.monotonic())
+        return 429 if len(arrivals) <= count else injected()
+
+    fake._injected_failure = failure
+    return arrivals
+
+
+def test_429_is_retried_until_the_throttle_deadline(bookstack):
+    arrivals = throttle_first(bookstack, 10)
+    api = BookStackAPI(bookstack.url, 'test', 'test', throttle_deadline=1.5)
+    with pytest.raises(requests.HTTPError) as raised:
+        api.get_books()
+    api.close()
+
+    assert raised.value.response.status_code == 429
+    # Retried once after Retry-After; the next retry would end past the deadline
+    assert len(arrivals) == 2
+    assert arrivals[1] - arrivals[0] >= 0.9
+    assert api.limiter.throttled == 1
+
+
+def test_429_pauses_every_worker(bookstack):
+    arrivals = throttle_first(bookstack, 1)
+    api = BookStackAPI(bookstack.url, 'test', 'test')
+    first = threading.Thread(target=api.get_books)
+    first.start()
+    while not arrivals:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    api.get_books()
+    first.join()
+    api.close()
+
+    assert len(arrivals) == 3
+    # Neither the retry nor the other worker's request went out during the pause
+    assert min(arrivals[1:]) - arrivals[0] >= 0.9
+    assert api.limiter.throttled == 1
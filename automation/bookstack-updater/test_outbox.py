@@ -0,0 +1,99 @@
+"""Tests for the BookStack outbox: queueing, flushing and dead letters against the fake API"""
+
+import pytest
+
+import fakes
+from bookstack_updater import BookStackPublisher, BufferedLog, content_hash
+
+
+@pytest.fixture
+def bookstack():
+    fake = fakes.FakeBookStack().start()
+    yield fake
+    fake.stop()
+
+
+def make_publisher(tmp_path, url: str, **kwargs) -> BookStackPublisher:
+    config = {'url': url, 'api_token_id': 'test', 'api_token_secret': 'test',
+              'rate_limit': 0, 'retries': 0}
+    return BookStackPublisher('bookstack', config, tmp_path / 'hashes.json', tmp_path / 'outbox.db',
+                              concurrency=2, use_outbox=True, **kwargs)
+
+
+def publish(publisher: BookStackPublisher, name: str, content: str):
+    return publisher.publish('Book', 'Chapter', name, content, content_hash(content), BufferedLog())
+
+
+def pages(fake: fakes.FakeBookStack):
+    return {page['name']: page['markdown'] for page in fake.items['pages'].values()}
+
+
+def test_pages_are_queued_then_flushed(tmp_path, bookstack):
+    publisher = make_publisher(tmp_path, bookstack.url)
+    publisher.start()
+    stats = publisher.new_stats()
+    assert publish(publisher, 'One', 'first') == 'queued'
+    assert publish(publisher, 'Two', 'second') == 'queued'
+    assert not bookstack.items['pages']
+
+    publisher.finish(stats)
+    publisher.close()
+    assert stats['created'] == 2
+    assert stats['pending'] == 0
+    assert pages(bookstack) == {'One': 'first', 'Two': 'second'}
+
+    publisher = make_publisher(tmp_path, bookstack.url)
+    publisher.start()
+    assert publish(publisher, 'One', 'first') == 'unchanged'
+    publisher.close()
+
+
+def test_outage_keeps_pages_without_counting_attempts(tmp_path, bookstack):
+    down = make_publisher(tmp_path, 'http://127.0.0.1:9')
+    down.start()
+    assert not down.available
+    stats = down.new_stats()
+    assert publish(down, 'One', 'first') == 'queued'
+    down.finish(stats)
+    assert stats['pending'] == 1
+    assert [entry['attempts'] for batch in down.outbox.batches(10) for entry in batch] == [0]
+    down.close()
+
+    publisher = make_publisher(tmp_path, bookstack.url)
+    stats = publisher.new_stats()
+    publisher.flush(stats)
+    publisher.close()
+    assert stats['created'] == 1
+    assert stats['pending'] == 0
+    assert pages(bookstack) == {'One': 'first'}
+
+
+def test_rejected_page_is_given_up_after_max_attempts(tmp_path, bookstack):
+    publisher = make_publisher(tmp_path, bookstack.url, max_attempts=2)
+    publisher.start()
+    publish(publisher, 'One', 'first')
+    publisher.finish(publisher.new_stats())
+    publisher.close()
+    # Gone on the server but still in the index, so updates are answered 404
+    bookstack.items['pages'].clear()
+
+    results = []
+    for _ in range(2):
+        publisher = make_publisher(tmp_path, bookstack.url, max_attempts=2)
+        publisher.start()
+        publisher.index.add(1, 'Book', 'Chapter', 'One')
+        stats = publisher.new_stats()
+        publish(publisher, 'One', 'second')
+        publisher.finish(stats)
+        results.append((stats['errors'], stats['dead'], stats['pending']))
+        publisher.close()
+    assert results == [(1, 0, 1), (0, 1, 0)]
+
+    publisher = make_publisher(tmp_path, bookstack.url, max_attempts=2)
+    publisher.start()
+    assert publish(publisher, 'One', 'second') == 'errors'
+    assert len(publisher.outbox) == 0
+    # New content for the page is queued again
+    assert publish(publisher, 'One', 'third') == 'queued'
+    assert len(publisher.outbox) == 1
+    publisher.close()
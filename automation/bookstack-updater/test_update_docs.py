@@ -0,0 +1,219 @@
+"""End-to-end update_docs tests against the fake BookStack API and synthetic audit data"""
+
+import threading
+
+import pytest
+import yaml
+
+import fakes
+from bookstack_updater import BookStackUpdater, FilesystemPublisher, MetricHistory
+
+
+@pytest.fixture
+def bookstack():
+    fake = fakes.FakeBookStack().start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def results_dir(tmp_path):
+    fakes.generate_audit_data(tmp_path / 'results')
+    return tmp_path / 'results'
+
+
+def make_updater(tmp_path, results_dir, bookstack, **kwargs) -> BookStackUpdater:
+    path = fakes.write_config(tmp_path, results_dir, bookstack.url, **kwargs)
+    return BookStackUpdater(str(path))
+
+
+def test_unreadable_audit_file_fails_only_its_pages(tmp_path, results_dir, bookstack):
+    vms = results_dir / 'proxmox-vms.json'
+    vms.write_text(vms.read_text()[:100])
+    updater = make_updater(tmp_path, results_dir, bookstack)
+    assert updater.history is not None
+    stats = updater.update_docs()
+    updater.close()
+
+    assert stats['created'] == 3
+    assert stats['errors'] == 1
+    assert 'VM Inventory' not in {page['name'] for page in bookstack.items['pages'].values()}
+
+
+def test_render_workers_hand_pages_to_sync_threads(tmp_path, results_dir, monkeypatch):
+    written = []
+    write = FilesystemPublisher._write
+
+    def record(self, *args):
+        written.append(threading.current_thread().name)
+        write(self, *args)
+
+    monkeypatch.setattr(FilesystemPublisher, '_write', record)
+    render = BookStackUpdater.render_page
+
+    def fail_network(self, template_name, *args):
+        if template_name == 'network.md.j2':
+            raise RuntimeError('broken template')
+        return render(self, template_name, *args)
+
+    # Patched before the fork, so the render workers fail this page too
+    monkeypatch.setattr(BookStackUpdater, 'render_page', fail_network)
+    path = fakes.write_config(tmp_path, results_dir, 'http://127.0.0.1:9', concurrency=1,
+                              render_workers=2, targets=('filesystem',))
+    updater = BookStackUpdater(str(path))
+    stats = updater.update_docs()
+    updater.close()
+
+    assert stats['errors'] == 1
+    assert stats['created'] == 3
+    assert len(written) == 3
+    assert all(name.startswith('ThreadPoolExecutor') for name in written)
+
+
+def test_trends_follow_the_configured_windows(tmp_path, results_dir):
+    path = fakes.write_config(tmp_path, results_dir, 'http://127.0.0.1:9', targets=('filesystem',))
+    config = yaml.safe_load(path.read_text())
+    config['history'] = {'enabled': True, 'windows': [14, 90]}
+    path.write_text(yaml.safe_dump(config))
+    updater = BookStackUpdater(str(path))
+    stats = updater.update_docs()
+
+    assert stats['errors'] == 0
+    page = (tmp_path / 'docs' / 'infrastructure' / 'virtual-machines' / 'vm-inventory.md').read_text()
+    assert '| VM | CPU avg 14d | CPU p95 90d |' in page
+
+    # A VM without samples in a window, e.g. one that was away from the audits
+    windows = {f'{stat}_{days}d': None for stat in ('mean', 'p95', 'growth') for days in (14, 90)}
+    trends = {vm.name: {field: dict(windows) for field in MetricHistory.FIELDS}
+              for vm in updater.parser.get_vms()}
+    page = updater.render_page('vms.md.j2', updater.build_context(vm_trends=trends))
+    updater.close()
+    assert '| - | - | - | - | - |' in page
+
+
+def shard_cluster_state(path):
+    """Shard the Cluster State page of the example config by namespace"""
+    config = yaml.safe_load(path.read_text())
+    for chapter in config['books']['infrastructure']['chapters']:
+        for page in chapter['pages']:
+            if page['name'] == 'Cluster State':
+                page.update(template='templates/k3s-index.md.j2', shard_by='namespace',
+                            shard_template='templates/k3s-namespace.md.j2')
+    path.write_text(yaml.safe_dump(config))
+
+
+def test_stale_shards_are_deleted_but_not_lookalikes(tmp_path, results_dir, bookstack):
+    path = fakes.write_config(tmp_path, results_dir, bookstack.url)
+    shard_cluster_state(path)
+    updater = BookStackUpdater(str(path))
+    stats = updater.update_docs()
+    updater.close()
+    names = {page['name'] for page in bookstack.items['pages'].values()}
+    assert stats['errors'] == 0
+    assert {'Cluster State', 'Cluster State: ns-0000', 'Cluster State: ns-0014'} <= names
+
+    chapter_id = next(chapter['id'] for chapter in bookstack.items['chapters'].values()
+                      if chapter['name'] == 'K3s Cluster')
+    bookstack._create('pages', {'name': 'Cluster State: upgrade notes', 'chapter_id': chapter_id,
+                                'markdown': 'Written by hand'})
+    # ns-0014 is gone from the cluster
+    for table in results_dir.glob('k3s-*.txt'):
+        table.write_text(''.join(line for line in table.read_text().splitlines(keepends=True)
+                                 if 'ns-0014' not in line))
+
+    updater = BookStackUpdater(str(path))
+    stats = updater.update_docs()
+    updater.close()
+    names = {page['name'] for page in bookstack.items['pages'].values()}
+    assert stats['deleted'] == 1
+    assert 'Cluster State: ns-0014' not in names
+    assert {'Cluster State: ns-0000', 'Cluster State: upgrade notes'} <= names
+
+
+def test_pages_with_unchanged_inputs_are_skipped(tmp_path, results_dir, bookstack):
+    updater = make_updater(tmp_path, results_dir, bookstack)
+    assert updater.update_docs()['created'] == 4
+    updater.close()
+    bookstack.reset_counters()
+
+    updater = make_updater(tmp_path, results_dir, bookstack)
+    stats = updater.update_docs()
+    updater.close()
+    assert stats['skipped'] == 4
+    # Only the remote index listings
+    assert set(bookstack.requests) == {'GET /api/books', 'GET /api/chapters', 'GET /api/pages'}
+
+    vms = results_dir / 'proxmox-vms.json'
+    vms.write_text(vms.read_text().replace('synthetic workload 0"', 'database server"'))
+    updater = make_updater(tmp_path, results_dir, bookstack)
+    stats = updater.update_docs()
+    updater.close()
+    assert stats['skipped'] == 3
+    assert stats['updated'] == 1
+    assert any('database server' in page['markdown'] for page in bookstack.items['pages'].values())
+
+
+def test_verify_remote_restores_hand_edits_of_unchanged_pages(tmp_path, results_dir, bookstack):
+    path = fakes.write_config(tmp_path, results_dir, bookstack.url)
+    config = yaml.safe_load(path.read_text())
+    config['sync']['verify_remote'] = True
+    path.write_text(yaml.safe_dump(config))
+    updater = BookStackUpdater(str(path))
+    updater.update_docs()
+    updater.close()
+    page = next(page for page in bookstack.items['pages'].values() if page['name'] == 'Network Overview')
+    rendered = page['markdown']
+    page['markdown'] = 'Edited by hand'
+
+    updater = BookStackUpdater(str(path))
+    stats = updater.update_docs()
+    updater.close()
+    assert stats['updated'] == 1
+    assert stats['unchanged'] == 3
+    assert page['markdown'] == rendered
+
+
+def test_pages_fan_out_to_every_target(tmp_path, results_dir, bookstack):
+    standby = fakes.FakeBookStack().start()
+    try:
+        path = fakes.write_config(tmp_path, results_dir, bookstack.url, standby_url=standby.url,
+                                  targets=('bookstack', 'standby', 'filesystem'))
+        updater = BookStackUpdater(str(path))
+        stats = updater.update_docs()
+        updater.close()
+    finally:
+        standby.stop()
+
+    assert {name: target['created'] for name, target in stats['targets'].items()} == {
+        'bookstack': 4, 'standby': 4, 'docs': 4}
+    assert stats['created'] == 12
+    assert ({page['markdown'] for page in bookstack.items['pages'].values()}
+            == {page['markdown'] for page in standby.items['pages'].values()})
+    assert len(list((tmp_path / 'docs').rglob('*.md'))) == 4
+
+
+def test_unavailable_target_sits_out_without_holding_up_the_others(tmp_path, results_dir, bookstack):
+    path = fakes.write_config(tmp_path, results_dir, bookstack.url, standby_url='http://127.0.0.1:9',
+                              targets=('bookstack', 'standby'))
+    config = yaml.safe_load(path.read_text())
+    config['bookstack']['retries'] = 0
+    path.write_text(yaml.safe_dump(config))
+    updater = BookStackUpdater(str(path))
+    stats = updater.update_docs()
+    updater.close()
+    assert stats['targets']['bookstack']['created'] == 4
+    assert stats['targets']['standby']['errors'] == 1
+
+    # The standby missed the pages, so the next run renders them again
+    standby = fakes.FakeBookStack().start()
+    try:
+        config['publish'][1]['url'] = standby.url
+        path.write_text(yaml.safe_dump(config))
+        updater = BookStackUpdater(str(path))
+        stats = updater.update_docs()
+        updater.close()
+    finally:
+        standby.stop()
+    assert stats['skipped'] == 0
+    assert stats['targets']['bookstack']['unchanged'] == 4
+    assert stats['targets']['standby']['created'] == 4